@@ -6,10 +6,61 @@
 ############################################################################################################
 
 # Importing dependencies
+import os
+import json
+import hashlib
 import numpy as np
 import pandas as pd
+from scipy.integrate import quad
+from scipy.special import ndtr
 from scipy.stats import logistic
 
+# Coefficients of the data generating mechanism by scenario, for the trial in the target population and in the
+#   secondary population. See Table 2 of the paper. Linear models are given as (intercept, X1, X2) and the missing data
+#   mechanism is either a probability or (intercept, X1) of a logistic model
+scenario_table = {
+    1: {'target': {'p_x1': 0.25, 'x2': (175, -10),
+                   'ya1': (50, -5, 1.1), 'ya2': (80, -5, 1.1), 'ya3': (110, -5, 1.1),
+                   'm': 0.15},
+        'second': {'p_x1': 0.25, 'x2': (175, -10),
+                   'ya1': (50, -5, 1.1), 'ya2': (80, -5, 1.1), 'ya3': (110, -5, 1.1),
+                   'm': 0.15}},
+    2: {'target': {'p_x1': 0.2, 'x2': (175 + 10, -20),
+                   'ya1': (35, -80, 1.0), 'ya2': (30, -10, 1.1), 'ya3': (40, 20, 1.2),
+                   'm': (-2.1, 0.5)},
+        'second': {'p_x1': 0.5, 'x2': (175, -20),
+                   'ya1': (35, -80, 1.0), 'ya2': (30, -10, 1.1), 'ya3': (40, 20, 1.2),
+                   'm': (-2.0, 0.5)}},
+    3: {'target': {'p_x1': 0.2, 'x2': (175 + 10, -20),
+                   'ya1': (35, -80, 1.0), 'ya2': (40, 10, 1.0), 'ya3': (40, 20, 1.2),
+                   'm': (-2.1, 0.5)},
+        'second': {'p_x1': 0.5, 'x2': (175, -20),
+                   'ya1': (35, -80, 1.0), 'ya2': (45, -10, 1.1), 'ya3': (40, 20, 1.2),
+                   'm': (-2.0, 0.5)}},
+    4: {'target': {'p_x1': 0.2, 'x2': (175 + 10, -20),
+                   'ya1': (45 - 0, -80, 1.0), 'ya2': (30, -10, 1.1), 'ya3': (30 + 20, 20, 1.2),
+                   'm': (-2.1, 0.5)},
+        'second': {'p_x1': 0.5, 'x2': (175, -20),
+                   'ya1': (45 - 30, -80, 1.0), 'ya2': (30, -10, 1.1), 'ya3': (30 + 0, 20, 1.2),
+                   'm': (-2.0, 0.5)}},
+    5: {'target': {'p_x1': 0.2, 'x2': (175 + 10, -20),
+                   'ya1': (45 - 0, -80, 1.0), 'ya2': (30, -10, 1.1), 'ya3': (30 + 20, 20, 1.2),
+                   'm': (-2.1, 0.5)},
+        'second': {'p_x1': 0.5, 'x2': (175, -20),
+                   'ya1': (45 - 30, -80, 1.0), 'ya2': (30 + 10, -10, 1.1), 'ya3': (30 + 0, 20, 1.2),
+                   'm': (-2.0, 0.5)}},
+}
+shared_coefficients = {'sd_x2': 30,         # Standard deviation of CD4 cell count
+                       'sd_y': 20,          # Standard deviation of potential outcomes
+                       'threshold': 250}    # Cut-point for the binary outcome
+
+# Storage types of the generated data. Treatment arm, trial, observed (missingness) indicators, X1, and the binary
+#   potential outcomes are stored as int8, and the continuous values as float64. Conversion to float64 only happens at
+#   the arithmetic boundary: in the design matrices (W and V, which hold the intercept and X1) and when the data is
+#   bound by an estimator (``_setup_`` in efuncs.py), where the subsets are kept as boolean masks. Observed outcomes
+#   are float64 since NaN marks a missing outcome. The truth can be drawn in float32 (``dtype`` of ``stream_truth``),
+#   with the means and squared deviations still accumulated in float64
+
 
 def generate_data(n1, n0, scenario):
     """Generate the data set for the specified trial sizes and scenario.
@@ -41,13 +92,152 @@ def generate_data(n1, n0, scenario):
               + np.where(d['A'] == 3, 1, 0)*d['Ba3'])
     d['Y'] = np.where(d['M'] == 1, np.nan, d['Y'])       # Setting as NaN if missing
     d['B'] = np.where(d['M'] == 1, np.nan, d['B'])       # Setting as NaN if missing
-    d['C'] = 1                                           # Intercept term for design matrices
+    d['C'] = np.int8(1)                                  # Intercept term for design matrices
 
     # Returning setup data
     return d
 
 
-def calculate_truth(n, scenario):
+def generate_arrays(n1, n0, scenario, rng):
+    """Generate the data set for the specified trial sizes and scenario as NumPy arrays ready for the estimating
+    functions. Unlike ``generate_data``, no DataFrame is built, draws come from the provided random number generator,
+    and only the potential outcome under the assigned treatment is drawn (which has the same distribution as drawing
+    all three and applying causal consistency).
+
+    Parameters
+    ----------
+    n1 : int
+        Number of observations to generate for the trial in the target population
+    n0 : int
+        Number of observations to generate for the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    rng : Generator
+        NumPy random number generator, e.g., ``np.random.default_rng(seed)``
+
+    Returns
+    -------
+    dict :
+        Continuous outcome ``y`` and binary outcome ``b`` (NaN if missing), assigned treatment arm ``a``, trial
+        indicator ``r`` (1 for the target population), observed indicator ``m`` (1 if the outcome is observed), and
+        the design matrices ``W`` (intercept, X1, X2) and ``V`` (intercept, X1). Rows of the target population come
+        first.
+    """
+    n = n1 + n0
+    data = {'y': np.empty(n, dtype=np.float64),
+            'b': np.empty(n, dtype=np.float64),
+            'a': np.empty(n, dtype=np.int8),
+            'r': np.zeros(n, dtype=np.int8),
+            'm': np.empty(n, dtype=np.int8),
+            'W': np.ones((n, 3), dtype=np.float64),
+            'V': np.ones((n, 2), dtype=np.float64)}
+    data['r'][:n1] = 1
+    _draw_arrays_(data, rows=slice(0, n1), c=_target_coefficients_(scenario=scenario), arms=(2, 3), rng=rng)
+    _draw_arrays_(data, rows=slice(n1, n), c=_second_coefficients_(scenario=scenario), arms=(1, 2), rng=rng)
+    return data
+
+
+def generate_batch(sims, n1, n0, scenario, rng, mmap_dir=None):
+    """Generate all replicates of a scenario at once. Each array of ``generate_arrays`` gains a leading replicate axis,
+    so ``data['y'][i]`` is the outcome of replicate ``i`` and is a view (no copy). Every replicate has the same
+    distribution as a call to ``generate_arrays``.
+
+    Parameters
+    ----------
+    sims : int
+        Number of replicates to generate
+    n1 : int
+        Number of observations to generate for the trial in the target population
+    n0 : int
+        Number of observations to generate for the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    rng : Generator
+        NumPy random number generator, e.g., ``np.random.default_rng(seed)``
+    mmap_dir : str, None, optional
+        Directory to store the arrays as memory-mapped ``.npy`` files, for batches that should not be held in memory.
+        Default is None, which keeps the arrays in memory.
+
+    Returns
+    -------
+    dict :
+        Same keys as ``generate_arrays``, with shapes ``(sims, n1+n0)`` and ``(sims, n1+n0, k)`` for the design
+        matrices
+    """
+    n = n1 + n0
+    data = _allocate_batch_(sims=sims, n1=n1, n0=n0, mmap_dir=mmap_dir)
+    _draw_arrays_(data, rows=slice(0, n1), c=_target_coefficients_(scenario=scenario), arms=(2, 3), rng=rng)
+    _draw_arrays_(data, rows=slice(n1, n), c=_second_coefficients_(scenario=scenario), arms=(1, 2), rng=rng)
+    return data
+
+
+def draw_common(sims, n1, n0, rng):
+    """Draw the random numbers that the data sets are made from, before any scenario is applied. ``apply_scenario``
+    turns them into the data sets of any scenario and any trial sizes up to ``n1`` and ``n0`` (using the first draws),
+    so the same draws can be shared by all cells of the simulation grid (common random numbers).
+
+    Parameters
+    ----------
+    sims : int
+        Number of replicates to generate
+    n1 : int
+        Largest number of observations for the trial in the target population
+    n0 : int
+        Largest number of observations for the trial in the secondary population
+    rng : Generator
+        NumPy random number generator, e.g., ``np.random.default_rng(seed)``
+
+    Returns
+    -------
+    dict :
+        Uniform draws for X1, the treatment assignment, and the missing data mechanism (``u_x1``, ``u_a``, ``u_m``) and
+        standard normal draws for X2 and the outcome (``z_x2``, ``z_y``), with shape (sims, n), for the ``target`` and
+        ``second`` populations
+    """
+    common = {}
+    for population, n in (('target', n1), ('second', n0)):
+        common[population] = {'u_x1': rng.random(size=(sims, n)),
+                              'z_x2': rng.standard_normal(size=(sims, n)),
+                              'u_a': rng.random(size=(sims, n)),
+                              'z_y': rng.standard_normal(size=(sims, n)),
+                              'u_m': rng.random(size=(sims, n))}
+    return common
+
+
+def apply_scenario(common, n1, n0, scenario):
+    """Generate a batch of data sets for a scenario from the common random numbers of ``draw_common``, using the first
+    ``n1`` and ``n0`` draws of each population. Each replicate has the same distribution as a call to
+    ``generate_arrays``. Data sets of different scenarios or trial sizes made from the same draws are coupled, so the
+    differences between them have less Monte Carlo error than with independent draws.
+
+    Parameters
+    ----------
+    common : dict
+        Random numbers from ``draw_common``
+    n1 : int
+        Number of observations for the trial in the target population
+    n0 : int
+        Number of observations for the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+
+    Returns
+    -------
+    dict :
+        Same output as ``generate_batch``
+    """
+    if n1 > common['target']['u_x1'].shape[1] or n0 > common['second']['u_x1'].shape[1]:
+        raise ValueError("Trial sizes are larger than the common random numbers")
+    sims, n = common['target']['u_x1'].shape[0], n1 + n0
+    data = _allocate_batch_(sims=sims, n1=n1, n0=n0)
+    _apply_draws_(data, rows=slice(0, n1), c=_target_coefficients_(scenario=scenario), arms=(2, 3),
+                  draws={key: value[:, :n1] for key, value in common['target'].items()})
+    _apply_draws_(data, rows=slice(n1, n), c=_second_coefficients_(scenario=scenario), arms=(1, 2),
+                  draws={key: value[:, :n0] for key, value in common['second'].items()})
+    return data
+
+
+def calculate_truth(n, scenario, seed=None, block_size=None, dtype=np.float64):
     """Estimate the true value empirically by comparing potential outcomes of a simulation
 
     Parameters
@@ -56,57 +246,284 @@ def calculate_truth(n, scenario):
         Number of observations to generate for the target population
     scenario : int
         Scenario for the data generating mechanism, 1-5 are valid options.
+    seed : int, None, optional
+        Seed for a random number generator of this call only (``np.random.RandomState``, which gives the same draws
+        as seeding NumPy's global random number generator without changing its state). Default is None, which uses
+        the current state of NumPy's global random number generator.
+    block_size : int, None, optional
+        Number of observations to generate at a time. Default is None, which generates all ``n`` observations at once.
+        When specified, ``stream_truth`` is used so memory does not grow with ``n``.
+    dtype : dtype, optional
+        Floating point type of the draws. Default is float64. Other types (i.e., float32) use ``stream_truth``, with
+        blocks of 1 million observations if ``block_size`` is None.
 
     Returns
     -------
     float, float
     """
-    d = _target_pop_(n=n, scenario=scenario)    # Generate observations in target population
+    if block_size is not None or np.dtype(dtype) != np.float64:
+        truth, _ = stream_truth(n=n, scenario=scenario, block_size=1000000 if block_size is None else block_size,
+                                seed=seed, dtype=dtype)
+        return truth
+    random_state = np.random if seed is None else np.random.RandomState(seed)
+    d = _target_pop_(n=n, scenario=scenario,    # Generate observations in target population
+                     random_state=random_state)
     return [np.mean(d['Ya3'] - d['Ya1']),       # Calculate ATE using potential outcomes
             np.mean(d['Ba3'] - d['Ba1'])]       # ... for both outcome types and return
 
 
-def _target_pop_(n, scenario):
+def stream_truth(n, scenario, block_size=1000000, seed=None, dtype=np.float64):
+    """Estimate the true value empirically in blocks of observations. Only the potential outcomes needed for the
+    average treatment effect are drawn, and only the running mean and sum of squared deviations of the differences are
+    kept, so at most one block is held in memory regardless of ``n``. Drawing in float32 halves the memory and bandwidth
+    of each block (and changes the random number stream), while the running totals stay in float64.
+
+    Parameters
+    ----------
+    n : int
+        Number of observations to generate for the target population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    block_size : int, optional
+        Number of observations to generate at a time. Default is 1 million.
+    seed : int, SeedSequence, None, optional
+        Seed for the random number generator. Default is None, which uses fresh entropy.
+    dtype : dtype, optional
+        Floating point type of the draws, float64 or float32. Default is float64.
+
+    Returns
+    -------
+    list, list :
+        True values for the continuous and binary outcomes, and the corresponding Monte Carlo standard errors
+    """
+    c = _target_coefficients_(scenario=scenario)
+    rng = np.random.default_rng(seed)
+    dtype = np.dtype(dtype)
+    count = 0
+    mean = np.zeros(2)                                              # Running means of Ya3-Ya1 and Ba3-Ba1
+    ssd = np.zeros(2)                                               # Running sum of squared deviations from the mean
+
+    while count < n:
+        k = min(block_size, n - count)
+        x1 = rng.binomial(n=1, p=c['p_x1'], size=k)
+        x2 = _normal_(rng, c['x2'][0] + c['x2'][1]*x1, scale=c['sd_x2'], dtype=dtype)
+        x2 = np.maximum(x2, 0)                                      # Bounding CD4 at zero
+        ya1 = _normal_(rng, c['ya1'][0] + c['ya1'][1]*x1 + c['ya1'][2]*x2, scale=c['sd_y'], dtype=dtype)
+        ya3 = _normal_(rng, c['ya3'][0] + c['ya3'][1]*x1 + c['ya3'][2]*x2, scale=c['sd_y'], dtype=dtype)
+        ya1 = np.maximum(ya1, 0)                                    # Bounding CD4 at zero
+        ya3 = np.maximum(ya3, 0)
+        diffs = (ya3 - ya1,                                         # Difference in potential outcomes
+                 (ya3 > c['threshold']).astype(np.int8) - (ya1 > c['threshold']))
+
+        # Combining the block with the running totals (Chan et al.'s pairwise update), in float64
+        for j, diff in enumerate(diffs):
+            block_mean = np.mean(diff, dtype=np.float64)
+            block_ssd = np.sum((diff - block_mean)**2, dtype=np.float64)
+            delta = block_mean - mean[j]
+            ssd[j] += block_ssd + delta**2 * count * k / (count + k)
+            mean[j] += delta * k / (count + k)
+        count += k
+
+    se = np.sqrt(ssd / (n - 1) / n)                                 # Monte Carlo standard error of the means
+    return list(mean), list(se)
+
+
+def exact_truth(scenario):
+    """Compute the true value by numerical integration rather than simulation. The potential outcomes are normal
+    conditional on X1 and the zero-bounded X2, and then bounded at zero themselves. So, given the covariates, the mean
+    of the bounded normal and the probability of exceeding the cut-point have closed forms. These are integrated over
+    the point mass of X2 at zero and its normal density above zero, and then averaged over X1.
+
+    Parameters
+    ----------
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+
+    Returns
+    -------
+    float, float
+    """
+    c = _target_coefficients_(scenario=scenario)
+    sd_y, cut = c['sd_y'], c['threshold']
+
+    def std_normal_pdf(z):
+        return np.exp(-0.5*z*z) / np.sqrt(2*np.pi)
+
+    def bounded_mean(mu):                                           # E[max(0, Y)] for Y ~ N(mu, sd_y)
+        return mu*ndtr(mu / sd_y) + sd_y*std_normal_pdf(mu / sd_y)
+
+    def exceed_prob(mu):                                            # Pr(max(0, Y) > cut) for Y ~ N(mu, sd_y)
+        return ndtr((mu - cut) / sd_y)
+
+    truth = np.zeros(2)
+    for x1, p_x1 in ((0, 1 - c['p_x1']), (1, c['p_x1'])):          # Average over X1
+        mu_x2 = c['x2'][0] + c['x2'][1]*x1
+        z0 = -mu_x2 / c['sd_x2']                                    # X2 is bounded at zero below this z-value
+        for j, f in enumerate((bounded_mean, exceed_prob)):         # ... for each outcome type
+
+            def diff(x2):                                           # Contrast of potential outcomes given X1, X2
+                return (f(c['ya3'][0] + c['ya3'][1]*x1 + c['ya3'][2]*x2)
+                        - f(c['ya1'][0] + c['ya1'][1]*x1 + c['ya1'][2]*x2))
+
+            at_zero = ndtr(z0) * diff(0)                            # Point mass of X2 at zero
+            above_zero = quad(lambda z: diff(mu_x2 + c['sd_x2']*z) * std_normal_pdf(z),
+                              z0, np.inf, epsabs=1e-12, epsrel=1e-12)[0]
+            truth[j] += p_x1 * (at_zero + above_zero)
+    return list(truth)
+
+
+def cached_truth(n, scenario, seed, cache_dir="cache", block_size=None, dtype=np.float64):
+    """Return the true values for both outcome types from ``calculate_truth``, computing them only once. The values
+    are stored in ``cache_dir`` under a key made of the scenario, number of observations, seed, and a hash of the data
+    generating coefficients, so later calls (including from later runs) read them back from disk.
+
+    Parameters
+    ----------
+    n : int
+        Number of observations to generate for the target population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    seed : int
+        Seed for the random number generator. Must be given, since truths without a seed differ between calls and so
+        cannot be reused.
+    cache_dir : str, optional
+        Directory for the stored truths. Default is ``cache``.
+    block_size : int, None, optional
+        Number of observations to generate at a time, see ``calculate_truth``. Default is None.
+    dtype : dtype, optional
+        Floating point type of the draws, see ``calculate_truth``. Default is float64.
+
+    Returns
+    -------
+    float, float
+    """
+    if seed is None:
+        raise ValueError("A seed is needed to cache the truth, since truths without a seed differ between calls")
+    coefs = json.dumps(_target_coefficients_(scenario=scenario), sort_keys=True)
+    coef_hash = hashlib.sha256(coefs.encode()).hexdigest()[:16]     # Hash of the data generating coefficients
+    key = "s" + str(scenario) + "_n" + str(n) + "_seed" + str(seed) + "_" + coef_hash
+    if block_size is not None:                                      # Block-wise draws use a different stream
+        key += "_b" + str(block_size)
+    if np.dtype(dtype) != np.float64:                               # ... as do draws of other types
+        key += "_" + np.dtype(dtype).str[1:]
+    path = os.path.join(cache_dir, "truth_" + key + ".npy")
+    if os.path.exists(path):                                        # Read truth from disk if already computed
+        return list(np.load(path))
+
+    truth = calculate_truth(n=n, scenario=scenario, seed=seed,      # Otherwise compute the truth
+                            block_size=block_size, dtype=dtype)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + "." + str(os.getpid()) + ".tmp"               # Write then rename, so a partial file is never read
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(truth, dtype=float))
+    os.replace(tmp_path, path)
+    return truth
+
+
+def _normal_(rng, loc, scale, dtype):
+    """Internal function for normal draws of the given floating point type. For float64, the draws are the same as
+    ``rng.normal(loc, scale)``.
+    """
+    z = rng.standard_normal(size=np.shape(loc), dtype=dtype)
+    return np.asarray(loc, dtype=dtype) + scale*z
+
+
+def _allocate_batch_(sims, n1, n0, mmap_dir=None):
+    """Internal function to allocate the arrays of ``generate_batch`` (in memory, or memory-mapped in ``mmap_dir``),
+    with the intercepts and trial indicator filled in.
+    """
+    n = n1 + n0
+    layout = {'y': ((sims, n), np.float64), 'b': ((sims, n), np.float64),
+              'a': ((sims, n), np.int8), 'r': ((sims, n), np.int8), 'm': ((sims, n), np.int8),
+              'W': ((sims, n, 3), np.float64), 'V': ((sims, n, 2), np.float64)}
+    data = {}
+    for key, (shape, dtype) in layout.items():
+        if mmap_dir is None:
+            data[key] = np.empty(shape, dtype=dtype)
+        else:
+            os.makedirs(mmap_dir, exist_ok=True)
+            data[key] = np.lib.format.open_memmap(os.path.join(mmap_dir, key + ".npy"), mode='w+',
+                                                  dtype=dtype, shape=shape)
+    data['W'][..., 0] = 1                                           # Intercept terms
+    data['V'][..., 0] = 1
+    data['r'][:, :n1] = 1
+    data['r'][:, n1:] = 0
+    return data
+
+
+def _draw_arrays_(data, rows, c, arms, rng):
+    """Internal function to draw a trial population into the preallocated arrays of ``generate_arrays`` or
+    ``generate_batch``. Arrays may have a leading replicate axis, in which case all replicates are drawn at once.
+    """
+    size = data['a'][..., rows].shape
+
+    # Covariates (baseline IDU and CD4 cell count bounded at zero)
+    x1 = rng.binomial(n=1, p=c['p_x1'], size=size)
+    x2 = np.maximum(rng.normal(c['x2'][0] + c['x2'][1]*x1, scale=c['sd_x2'], size=size), 0)
+
+    # Treatment assignment (1:1) and potential outcome under the assigned treatment, bounded at zero
+    a = rng.binomial(n=1, p=0.5, size=size) + arms[0]
+    coefs = np.array([c['ya1'], c['ya2'], c['ya3']], dtype=float)[a - 1]
+    y = np.maximum(rng.normal(coefs[..., 0] + coefs[..., 1]*x1 + coefs[..., 2]*x2, scale=c['sd_y'], size=size), 0)
+
+    # Missing data mechanism
+    if np.ndim(c['m']) == 0:
+        observed = rng.random(size=size) >= c['m']
+    else:
+        observed = rng.random(size=size) >= logistic.cdf(c['m'][0] + c['m'][1]*x1)
+    _fill_arrays_(data, rows=rows, c=c, x1=x1, x2=x2, a=a, y=y, observed=observed)
+
+
+def _apply_draws_(data, rows, c, arms, draws):
+    """Internal function to turn the common random numbers of a trial population (from ``draw_common``) into the
+    preallocated arrays of ``apply_scenario``, by inversion. Same mechanism as ``_draw_arrays_``.
+    """
+    # Covariates (baseline IDU and CD4 cell count bounded at zero)
+    x1 = (draws['u_x1'] < c['p_x1']).astype(np.int64)
+    x2 = np.maximum(c['x2'][0] + c['x2'][1]*x1 + c['sd_x2']*draws['z_x2'], 0)
+
+    # Treatment assignment (1:1) and potential outcome under the assigned treatment, bounded at zero
+    a = (draws['u_a'] < 0.5) + arms[0]
+    coefs = np.array([c['ya1'], c['ya2'], c['ya3']], dtype=float)[a - 1]
+    y = np.maximum(coefs[..., 0] + coefs[..., 1]*x1 + coefs[..., 2]*x2 + c['sd_y']*draws['z_y'], 0)
+
+    # Missing data mechanism
+    if np.ndim(c['m']) == 0:
+        observed = draws['u_m'] >= c['m']
+    else:
+        observed = draws['u_m'] >= logistic.cdf(c['m'][0] + c['m'][1]*x1)
+    _fill_arrays_(data, rows=rows, c=c, x1=x1, x2=x2, a=a, y=y, observed=observed)
+
+
+def _fill_arrays_(data, rows, c, x1, x2, a, y, observed):
+    """Internal function to write the draws of a trial population into the preallocated arrays."""
+    data['W'][..., rows, 1] = x1
+    data['W'][..., rows, 2] = x2
+    data['V'][..., rows, 1] = x1
+    data['a'][..., rows] = a
+    data['m'][..., rows] = observed
+    data['y'][..., rows] = np.where(observed, y, np.nan)
+    data['b'][..., rows] = np.where(observed, y > c['threshold'], np.nan)
+
+
+def _target_pop_(n, scenario, random_state=np.random):
     """Internal function called to generate data for the target population according to the requested scenario. See
-    Table 2 of the paper.
+    Table 2 of the paper. The draws are made with ``random_state`` (NumPy's global random number generator by
+    default).
     """
+    c = _target_coefficients_(scenario=scenario)
+
     # Covariate 1 (baseline IDU)
-    if scenario == 1:
-        p1 = 0.25
-    elif scenario in [2, 3, 4, 5]:
-        p1 = 0.2
-    else:
-        raise ValueError("Invalid scenario")
-    x1 = np.random.binomial(n=1, p=p1, size=n)
+    x1 = random_state.binomial(n=1, p=c['p_x1'], size=n)
 
     # Covariate 2 (baseline CD4 cell count)
-    if scenario == 1:
-        x2 = np.random.normal(175 - 10*x1, scale=30, size=n)
-    else:
-        x2 = np.random.normal(175 + 10 - 20*x1, scale=30, size=n)
+    x2 = random_state.normal(c['x2'][0] + c['x2'][1]*x1, scale=c['sd_x2'], size=n)
     x2 = np.where(x2 < 0, 0, x2)                                    # Bounding CD4 at zero
 
     # Potential outcomes under each treatment by scenario
-    if scenario == 1:
-        ya1 = np.random.normal(50 - 5*x1 + 1.1*x2, scale=20, size=n)
-        ya2 = np.random.normal(80 - 5*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(110 - 5*x1 + 1.1*x2, scale=20, size=n)
-    elif scenario == 2:
-        ya1 = np.random.normal(35 - 80*x1 + 1.0*x2, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(40 + 20*x1 + 1.2*x2, scale=20, size=n)
-    elif scenario == 3:
-        ya1 = np.random.normal(35 - 80*x1 + 1.0*x2, scale=20, size=n)
-        ya2 = np.random.normal(40 + 10*x1 + 1.0*x2, scale=20, size=n)
-        ya3 = np.random.normal(40 + 20*x1 + 1.2*x2, scale=20, size=n)
-    elif scenario == 4:
-        ya1 = np.random.normal(45 - 80*x1 + 1.0*x2 - 0, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(30 + 20*x1 + 1.2*x2 + 20, scale=20, size=n)
-    else:
-        ya1 = np.random.normal(45 - 80*x1 + 1.0*x2 - 0, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2 + 0, scale=20, size=n)
-        ya3 = np.random.normal(30 + 20*x1 + 1.2*x2 + 20, scale=20, size=n)
+    ya1 = random_state.normal(c['ya1'][0] + c['ya1'][1]*x1 + c['ya1'][2]*x2, scale=c['sd_y'], size=n)
+    ya2 = random_state.normal(c['ya2'][0] + c['ya2'][1]*x1 + c['ya2'][2]*x2, scale=c['sd_y'], size=n)
+    ya3 = random_state.normal(c['ya3'][0] + c['ya3'][1]*x1 + c['ya3'][2]*x2, scale=c['sd_y'], size=n)
 
     # Bounding CD4 at zero
     ya1 = np.where(ya1 < 0, 0, ya1)
@@ -114,76 +531,64 @@ def _target_pop_(n, scenario):
     ya3 = np.where(ya3 < 0, 0, ya3)
 
     # Binary outcome version from CD4 (CD4 > 250)
-    ba1 = np.where(ya1 > 250, 1, 0)
-    ba2 = np.where(ya2 > 250, 1, 0)
-    ba3 = np.where(ya3 > 250, 1, 0)
+    ba1 = np.where(ya1 > c['threshold'], 1, 0).astype(np.int8)
+    ba2 = np.where(ya2 > c['threshold'], 1, 0).astype(np.int8)
+    ba3 = np.where(ya3 > c['threshold'], 1, 0).astype(np.int8)
 
     # Missing data mechanism
-    if scenario == 1:
-        m = np.random.binomial(n=1, p=0.15, size=n)
+    if np.ndim(c['m']) == 0:
+        m = random_state.binomial(n=1, p=c['m'], size=n)
     else:
-        m = np.random.binomial(n=1, p=logistic.cdf(-2.1 + 0.5*x1), size=n)
+        m = random_state.binomial(n=1, p=logistic.cdf(c['m'][0] + c['m'][1]*x1), size=n)
 
     # Treatment assignment mechanism
-    a = np.random.binomial(n=1, p=0.5, size=n) + 2
+    a = random_state.binomial(n=1, p=0.5, size=n) + 2
 
     # Creating as a pandas data set
     d = pd.DataFrame()
-    d['X1'] = x1
+    d['X1'] = x1.astype(np.int8)                                    # Indicators stored as int8 (see above)
     d['X2'] = x2
-    d['A'] = a
+    d['A'] = a.astype(np.int8)
     d['Ya1'] = ya1
     d['Ya2'] = ya2
     d['Ya3'] = ya3
     d['Ba1'] = ba1
     d['Ba2'] = ba2
     d['Ba3'] = ba3
-    d['M'] = m
-    d['S'] = 1
+    d['M'] = m.astype(np.int8)
+    d['S'] = np.int8(1)
     return d
 
 
-def _second_pop_(n, scenario):
+def _target_coefficients_(scenario):
+    """Internal function with the coefficients of the data generating mechanism for the target population according to
+    the requested scenario, from ``scenario_table`` and ``shared_coefficients``.
+    """
+    if scenario not in scenario_table:
+        raise ValueError("Invalid scenario")
+    c = dict(scenario_table[scenario]['target'])
+    c.update(shared_coefficients)
+    return c
+
+
+def _second_pop_(n, scenario, random_state=np.random):
     """Internal function called to generate data for the secondary population according to the requested scenario. See
-    Table 2 of the paper.
+    Table 2 of the paper. The draws are made with ``random_state`` (NumPy's global random number generator by
+    default).
     """
+    c = _second_coefficients_(scenario=scenario)
+
     # Covariate 1 (baseline IDU)
-    if scenario == 1:
-        p1 = 0.25
-    elif scenario in [2, 3, 4, 5]:
-        p1 = 0.5
-    else:
-        raise ValueError("Invalid scenario")
-    x1 = np.random.binomial(n=1, p=p1, size=n)
+    x1 = random_state.binomial(n=1, p=c['p_x1'], size=n)
 
     # Covariate 2 (baseline CD4 cell count)
-    if scenario == 1:
-        x2 = np.random.normal(175 - 10*x1, scale=30, size=n)
-    else:
-        x2 = np.random.normal(175 - 20*x1, scale=30, size=n)
+    x2 = random_state.normal(c['x2'][0] + c['x2'][1]*x1, scale=c['sd_x2'], size=n)
     x2 = np.where(x2 < 0, 0, x2)                               # Bounding CD4 by zero
 
     # Potential outcomes under each treatment by scenario
-    if scenario == 1:
-        ya1 = np.random.normal(50 - 5*x1 + 1.1*x2, scale=20, size=n)
-        ya2 = np.random.normal(80 - 5*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(110 - 5*x1 + 1.1*x2, scale=20, size=n)
-    elif scenario == 2:
-        ya1 = np.random.normal(35 - 80*x1 + 1.0*x2, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(40 + 20*x1 + 1.2*x2, scale=20, size=n)
-    elif scenario == 3:
-        ya1 = np.random.normal(35 - 80*x1 + 1.0*x2, scale=20, size=n)
-        ya2 = np.random.normal(45 - 10*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(40 + 20*x1 + 1.2*x2, scale=20, size=n)
-    elif scenario == 4:
-        ya1 = np.random.normal(45 - 80*x1 + 1.0*x2 - 30, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2, scale=20, size=n)
-        ya3 = np.random.normal(30 + 20*x1 + 1.2*x2 + 0, scale=20, size=n)
-    else:
-        ya1 = np.random.normal(45 - 80*x1 + 1.0*x2 - 30, scale=20, size=n)
-        ya2 = np.random.normal(30 - 10*x1 + 1.1*x2 + 10, scale=20, size=n)
-        ya3 = np.random.normal(30 + 20*x1 + 1.2*x2 + 0, scale=20, size=n)
+    ya1 = random_state.normal(c['ya1'][0] + c['ya1'][1]*x1 + c['ya1'][2]*x2, scale=c['sd_y'], size=n)
+    ya2 = random_state.normal(c['ya2'][0] + c['ya2'][1]*x1 + c['ya2'][2]*x2, scale=c['sd_y'], size=n)
+    ya3 = random_state.normal(c['ya3'][0] + c['ya3'][1]*x1 + c['ya3'][2]*x2, scale=c['sd_y'], size=n)
 
     # Bounding CD4 by zero
     ya1 = np.where(ya1 < 0, 0, ya1)
@@ -191,30 +596,41 @@ def _second_pop_(n, scenario):
     ya3 = np.where(ya3 < 0, 0, ya3)
 
     # Generating binary outcome (CD4 > 250)
-    ba1 = np.where(ya1 > 250, 1, 0)
-    ba2 = np.where(ya2 > 250, 1, 0)
-    ba3 = np.where(ya3 > 250, 1, 0)
+    ba1 = np.where(ya1 > c['threshold'], 1, 0).astype(np.int8)
+    ba2 = np.where(ya2 > c['threshold'], 1, 0).astype(np.int8)
+    ba3 = np.where(ya3 > c['threshold'], 1, 0).astype(np.int8)
 
     # Missing data mechanism
-    if scenario == 1:
-        m = np.random.binomial(n=1, p=0.15, size=n)
+    if np.ndim(c['m']) == 0:
+        m = random_state.binomial(n=1, p=c['m'], size=n)
     else:
-        m = np.random.binomial(n=1, p=logistic.cdf(-2.0 + 0.5*x1), size=n)
+        m = random_state.binomial(n=1, p=logistic.cdf(c['m'][0] + c['m'][1]*x1), size=n)
 
     # Assigned treatment
-    a = np.random.binomial(n=1, p=0.5, size=n) + 1
+    a = random_state.binomial(n=1, p=0.5, size=n) + 1
 
     # Creating as a pandas data set
     d = pd.DataFrame()
-    d['X1'] = x1
+    d['X1'] = x1.astype(np.int8)                                    # Indicators stored as int8 (see above)
     d['X2'] = x2
-    d['A'] = a
+    d['A'] = a.astype(np.int8)
     d['Ya1'] = ya1
     d['Ya2'] = ya2
     d['Ya3'] = ya3
     d['Ba1'] = ba1
     d['Ba2'] = ba2
     d['Ba3'] = ba3
-    d['M'] = m
-    d['S'] = 0
+    d['M'] = m.astype(np.int8)
+    d['S'] = np.int8(0)
     return d
+
+
+def _second_coefficients_(scenario):
+    """Internal function with the coefficients of the data generating mechanism for the secondary population according
+    to the requested scenario, from ``scenario_table`` and ``shared_coefficients``.
+    """
+    if scenario not in scenario_table:
+        raise ValueError("Invalid scenario")
+    c = dict(scenario_table[scenario]['second'])
+    c.update(shared_coefficients)
+    return c
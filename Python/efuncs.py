@@ -111,7 +111,8 @@ def ee_bridge_ss(theta, y, a, r, m, W, V3, V1):
     V3 : ndarray, list
         Design matrix for the missing model, restricted to A=3
     V1 : ndarray, list
-        Design matrix for the missing model, restricted to A=1
+        Design matrix for the missing model, restricted to A=1. If the same array as ``V3`` is given, the linear
+        predictors of both missing models are computed with one matrix product.
 
     Returns
     -------
@@ -138,20 +139,18 @@ def ee_bridge_ss(theta, y, a, r, m, W, V3, V1):
     odds = pr_s1 / (1 - pr_s1)                       # Predicted odds of being R=2
     iosw = r*1 + (1-r)/odds                          # Inverse Odds of Sampling Weights
 
-    # Calculate the missing models, Pr(M | X, R, A; gamma), nuisance parameters
-    pr_m_nuisance_a2s1 = ee_regression(theta=gamma_a2s1,             # Using built-in regression
-                                       X=V3, y=m,                    # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a2s1 = pr_m_nuisance_a2s1 * (a == 3)               # Only A=3 arm contributes
-
-    pr_m_nuisance_a0s0 = ee_regression(theta=gamma_a0s0,             # Using built-in regression
-                                       X=V1, y=m,                    # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a0s0 = pr_m_nuisance_a0s0 * (a == 1)               # Only single arm contributes
+    # Calculate the missing models, Pr(M | X, R, A; gamma), nuisance parameters. Models given the same design matrix
+    #   share one matrix product, and the logistic scores (as from ee_regression) use the predicted probabilities
+    V3, V1 = np.asarray(V3), np.asarray(V1)
+    lp_a2s1, lp_a0s0 = _linear_predictors_((V3, V1), (gamma_a2s1, gamma_a0s0))
+    pr_m_a2s1 = inverse_logit(lp_a2s1)                               # Predicted probability of observed Y in A=3
+    pr_m_a0s0 = inverse_logit(lp_a0s0)                               # Predicted probability of observed Y in A=1
+    pr_m_nuisance_a2s1 = (m - pr_m_a2s1) * V3.T * (a == 3)           # Only A=3 arm contributes
+    pr_m_nuisance_a0s0 = (m - pr_m_a0s0) * V1.T * (a == 1)           # Only single arm contributes
 
-    pr_m = (inverse_logit(np.dot(V3, gamma_a2s1))*r*(a == 3)         # Compute all probability in R=2
+    pr_m = (pr_m_a2s1*r*(a == 3)                                     # Compute all probability in R=2
             + 1*(a == 2)                                             # ... prevent NaN errors
-            + inverse_logit(np.dot(V1, gamma_a0s0))*(1-r)*(a == 1))  # ... probability in R=1
+            + pr_m_a0s0*(1-r)*(a == 1))                              # ... probability in R=1
     ipmw = np.where(m, 1/pr_m, 0)                                    # Inverse probability of missing weight
 
     # Estimating functions for the mean in each arm for estimator
@@ -198,6 +197,9 @@ def ee_bridge_ms(theta, y, a, r, m, W, V3, V2a, V2b, V1):
     V1 : ndarray, list
         Design matrix for the missing model, restricted to A=1
 
+    Missing models given the same design matrix (the same array, e.g., ``V3=V, V2a=V, V2b=V, V1=V``) share one matrix
+    product of the design matrix and their stacked parameters for the linear predictors.
+
     Returns
     -------
     ndarray :
@@ -227,31 +229,24 @@ def ee_bridge_ms(theta, y, a, r, m, W, V3, V2a, V2b, V1):
     odds = pr_s1 / (1 - pr_s1)                              # Predicted odds of R=2
     iosw = r*1 + (1-r)/odds                                 # Inverse Odds of Sampling Weights
 
-    # Calculate the missing models, Pr(M | X, A, R; gamma), nuisance parameters
-    pr_m_nuisance_a2s1 = ee_regression(theta=gamma_a2s1,             # Using built-in regression
-                                       X=V3, y=m,                    # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a2s1 = pr_m_nuisance_a2s1 * (a == 3)               # Only A=3 arm contributes
-
-    pr_m_nuisance_a1s1 = ee_regression(theta=gamma_a1s1,             # Using built-in regression
-                                       X=V2a, y=m,                   # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a1s1 = pr_m_nuisance_a1s1 * r * (a == 2)           # Only A=2,R=2 arm contributes
-
-    pr_m_nuisance_a1s0 = ee_regression(theta=gamma_a1s0,             # Using built-in regression
-                                       X=V2b, y=m,                   # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a1s0 = pr_m_nuisance_a1s0 * (1-r) * (a == 2)       # Only A=2,R=1 arm contributes
-
-    pr_m_nuisance_a0s0 = ee_regression(theta=gamma_a0s0,             # Using built-in regression
-                                       X=V1, y=m,                    # ... given variables
-                                       model='logistic')             # ... with logistic model
-    pr_m_nuisance_a0s0 = pr_m_nuisance_a0s0 * (1-r) * (a == 1)       # Only A=1 arm contributes
-
-    pr_m = (inverse_logit(np.dot(V3, gamma_a2s1))*r*(a == 3)         # Compute all probability in A=3
-            + inverse_logit(np.dot(V2a, gamma_a1s1))*r*(a == 2)      # ... probability in A=2,R=2
-            + inverse_logit(np.dot(V2b, gamma_a1s0))*(1-r)*(a == 2)  # ... probability in A=2,R=1
-            + inverse_logit(np.dot(V1, gamma_a0s0))*(1-r)*(a == 1))  # ... probability in A=1
+    # Calculate the missing models, Pr(M | X, A, R; gamma), nuisance parameters. Models given the same design matrix
+    #   share one matrix product, and the logistic scores (as from ee_regression) use the predicted probabilities
+    V3, V2a, V2b, V1 = np.asarray(V3), np.asarray(V2a), np.asarray(V2b), np.asarray(V1)
+    lp_a2s1, lp_a1s1, lp_a1s0, lp_a0s0 = _linear_predictors_((V3, V2a, V2b, V1),
+                                                             (gamma_a2s1, gamma_a1s1, gamma_a1s0, gamma_a0s0))
+    pr_m_a2s1 = inverse_logit(lp_a2s1)                               # Predicted probability of observed Y in A=3
+    pr_m_a1s1 = inverse_logit(lp_a1s1)                               # ... in A=2,R=2
+    pr_m_a1s0 = inverse_logit(lp_a1s0)                               # ... in A=2,R=1
+    pr_m_a0s0 = inverse_logit(lp_a0s0)                               # ... in A=1
+    pr_m_nuisance_a2s1 = (m - pr_m_a2s1) * V3.T * (a == 3)           # Only A=3 arm contributes
+    pr_m_nuisance_a1s1 = (m - pr_m_a1s1) * V2a.T * r * (a == 2)      # Only A=2,R=2 arm contributes
+    pr_m_nuisance_a1s0 = (m - pr_m_a1s0) * V2b.T * (1-r) * (a == 2)  # Only A=2,R=1 arm contributes
+    pr_m_nuisance_a0s0 = (m - pr_m_a0s0) * V1.T * (1-r) * (a == 1)   # Only A=1 arm contributes
+
+    pr_m = (pr_m_a2s1*r*(a == 3)                                     # Compute all probability in A=3
+            + pr_m_a1s1*r*(a == 2)                                   # ... probability in A=2,R=2
+            + pr_m_a1s0*(1-r)*(a == 2)                               # ... probability in A=2,R=1
+            + pr_m_a0s0*(1-r)*(a == 1))                              # ... probability in A=1
     ipmw = np.where(m, 1/pr_m, 0)                                    # Inverse probability of missing weight
 
     # Estimating functions for the mean in each arm for estimator
@@ -275,3 +270,377 @@ def ee_bridge_ms(theta, y, a, r, m, W, V3, V2a, V2b, V1):
                       pr_s_nuisance,
                       pr_m_nuisance_a2s1, pr_m_nuisance_a1s1, pr_m_nuisance_a1s0, pr_m_nuisance_a0s0
                       ))
+
+
+def jac_bridge_ss(theta, y, a, r, m, W, V3, V1):
+    """Derivative of the summed stacked estimating functions of ``ee_bridge_ss`` with respect to ``theta``. Can be
+    used as the Jacobian in root-finding and (divided by -n) as the bread matrix of the sandwich variance. Arguments
+    are the same as for ``ee_bridge_ss``.
+
+    Returns
+    -------
+    ndarray :
+        Matrix where the (j, k) element is the sum over observations of the derivative of the j-th estimating function
+        with respect to the k-th parameter
+    """
+    return BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1).jacobian(theta)
+
+
+def jac_bridge_ms(theta, y, a, r, m, W, V3, V2a, V2b, V1):
+    """Derivative of the summed stacked estimating functions of ``ee_bridge_ms`` with respect to ``theta``. Can be
+    used as the Jacobian in root-finding and (divided by -n) as the bread matrix of the sandwich variance. Arguments
+    are the same as for ``ee_bridge_ms``.
+
+    Returns
+    -------
+    ndarray :
+        Matrix where the (j, k) element is the sum over observations of the derivative of the j-th estimating function
+        with respect to the k-th parameter
+    """
+    return BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V2a, V2b=V2b, V1=V1).jacobian(theta)
+
+
+class _ArmMeans_:
+    """Internal base class for the estimator classes. The stacked parameters are: the contrasts (ATE, diagnostic), the
+    mean in each arm subset, the sampling model, then each missing model. Without a sampling model, the weights are all
+    one (Naive estimators).
+
+    Each block is evaluated only on the rows that contribute to it, and the results are written into the stacked
+    output. The observations are sorted once so that these rows are contiguous, and the weights are only computed for
+    the rows with an observed outcome in one of the arm subsets.
+    """
+    def psi(self, theta):
+        """Stacked estimating functions evaluated at ``theta``. The columns (observations) are in the sorted order
+        ``self.order``, which does not change the sums over observations used by the M-estimator.
+
+        Parameters
+        ----------
+        theta : ndarray, list
+            Parameters to estimate
+
+        Returns
+        -------
+        ndarray
+        """
+        contrast, mu, beta, gammas = self._unpack_(theta)
+        ipw = self._weights_(beta=beta, gammas=gammas)
+        ef = np.zeros((self.n_params, self.n))
+        ef[self.blocks[0]] = (np.dot(self.contrasts, mu) - contrast)[:, None]      # ATE and diagnostic
+        for k, ((rows, pos, y), mu_k) in enumerate(zip(self.arms, mu)):            # Mean in each arm
+            ef[self.blocks[1].start + k, rows] = ipw[pos] * (y - mu_k)
+        if self.sampling is not None:                                               # Sampling and missing models
+            for j, (b, (rows, X, outcome), coef) in enumerate(zip(self.blocks[2:], [self.sampling] + self.models,
+                                                                   [beta] + gammas)):
+                ef[b, rows] = (outcome - self._fitted_(j, X, coef)) * X.T
+        return ef
+
+    def jacobian(self, theta):
+        """Derivative of the summed stacked estimating functions with respect to ``theta``.
+
+        Parameters
+        ----------
+        theta : ndarray, list
+            Parameters to estimate
+
+        Returns
+        -------
+        ndarray
+        """
+        contrast, mu, beta, gammas = self._unpack_(theta)
+        ipw = self._weights_(beta=beta, gammas=gammas)
+        jac = np.zeros((self.n_params, self.n_params))
+        bc, bm = self.blocks[0], self.blocks[1]
+
+        # ATE and diagnostic
+        jac[bc, bc] = -self.n * np.identity(self.contrasts.shape[0])
+        jac[bc, bm] = self.n * self.contrasts
+
+        # Means: derivative with respect to the mean is minus the weights, and with respect to the nuisance
+        #   parameters is the estimating function times the derivative of the log-weight
+        jac[bm, bm] = -np.diag([np.sum(ipw[pos]) for _, pos, _ in self.arms])
+        if self.sampling is not None:
+            ef_mu = np.zeros((len(self.arms), self.rows.shape[0]))                  # Mean rows, on weighted rows
+            for k, ((_, pos, y), mu_k) in enumerate(zip(self.arms, mu)):
+                ef_mu[k, pos] = ipw[pos] * (y - mu_k)
+            pos, X = self.inverse_odds                                              # log-IOSW is -W beta for R=0
+            jac[bm, self.blocks[2]] = -np.dot(ef_mu[:, pos], X)
+            for b, (pos, X), g in zip(self.blocks[3:], self.weighting, gammas):    # log-IPMW is -log(Pr(M=1))
+                jac[bm, b] = -np.dot(ef_mu[:, pos] * (1 - inverse_logit(np.dot(X, g))), X)
+
+            # Nuisance models: derivative of the logistic score
+            for j, (b, (_, X, _), coef) in enumerate(zip(self.blocks[2:], [self.sampling] + self.models,
+                                                          [beta] + gammas)):
+                jac[b, b] = self._fitted_(j, X, coef, deriv=True)
+        return jac
+
+    def _setup_(self, y, m, r, subsets, contrasts, W=None, sampling_subset=None, models=(), cache=None):
+        """Internal function that binds and preprocesses the data. Missing models are given as tuples of the design
+        matrix, the subset that contributes to the model, and the subset whose weights use the model (the latter
+        should not overlap between models). Indicators may be of any type (e.g., int8); the subsets are kept as
+        boolean masks, and only the outcomes, indicators used in arithmetic, and design matrices are converted to float.
+        """
+        m = np.asarray(m, dtype=float)
+        self.n = m.shape[0]
+        self.contrasts = np.asarray(contrasts, dtype=float)
+        observed = np.asarray(subsets, dtype=bool) & (m != 0)                  # Arm subsets with observed outcomes
+        models = [(V, np.asarray(ms, dtype=bool), np.asarray(ws, dtype=bool)) for V, ms, ws in models]
+
+        # Sorting the observations by subset membership, so each subset is a contiguous block of rows (slices instead
+        #   of index arrays). The columns of psi are in this order, which does not change the sums over observations
+        keys = list(observed[::-1]) + [ws for _, _, ws in models[::-1]] + [ms for _, ms, _ in models[::-1]]
+        if W is not None:
+            keys.append(np.asarray(sampling_subset, dtype=bool))
+        self.order = np.lexsort([~k for k in keys])
+        y = np.nan_to_num(np.asarray(y, dtype=float)[self.order], copy=True, nan=0.)  # Missing y to 0 to prevent NaN
+        m, r = m[self.order], np.asarray(r, dtype=float)[self.order]
+        observed = observed[:, self.order]
+
+        # Rows that need a weight, and the rows of each arm (also as positions among the weighted rows)
+        self.rows = np.flatnonzero(np.any(observed, axis=0))
+        self.arms = []
+        for subset in observed:
+            idx = np.flatnonzero(subset)
+            self.arms.append((_as_slice_(idx), _as_slice_(np.searchsorted(self.rows, idx)), y[idx]))
+
+        # Nuisance models, as the rows that contribute, the design matrix, and the outcome on those rows. For the
+        #   weights, the positions among the weighted rows that use the model and the design matrix there
+        if W is None:
+            self.sampling, self.inverse_odds, self.models, self.weighting = None, None, [], []
+        else:
+            W = np.asarray(W, dtype=float)[self.order]
+            rows = np.flatnonzero(np.asarray(sampling_subset, dtype=bool)[self.order])
+            self.sampling = (_as_slice_(rows), np.ascontiguousarray(W[rows]), 1 - r[rows])
+            pos = np.flatnonzero(r[self.rows] == 0)                             # Weighted rows using inverse odds
+            self.inverse_odds = (_as_slice_(pos), np.ascontiguousarray(W[self.rows[pos]]))
+            self.models, self.weighting = [], []
+            ordered = {}                                                        # Shared design matrices sorted once
+            for V, positions in _group_designs_([V for V, _, _ in models]):
+                V = np.asarray(V, dtype=float)[self.order]
+                ordered.update({k: V for k in positions})
+            for k, (_, ms, ws) in enumerate(models):
+                V = ordered[k]
+                rows = np.flatnonzero(ms[self.order])
+                self.models.append((_as_slice_(rows), np.ascontiguousarray(V[rows]), m[rows]))
+                pos = np.flatnonzero(ws[self.order][self.rows])
+                self.weighting.append((_as_slice_(pos), np.ascontiguousarray(V[self.rows[pos]])))
+
+        # Keys of the nuisance models (sampling model, then missing models) in the shared cache
+        self.cache = cache
+        self.keys = []
+        if cache is not None and self.sampling is not None:
+            self.keys = [cache.key(X, outcome) for _, X, outcome in [self.sampling] + self.models]
+
+        # Location of each block in theta
+        sizes = [self.contrasts.shape[0], self.contrasts.shape[1]]
+        if self.sampling is not None:
+            sizes += [self.sampling[1].shape[1]] + [X.shape[1] for _, X, _ in self.models]
+        self.blocks = [slice(start, stop) for start, stop in zip(np.cumsum([0] + sizes[:-1]), np.cumsum(sizes))]
+        self.n_params = int(np.sum(sizes))
+
+    def _unpack_(self, theta):
+        """Internal function to split theta into the contrasts, means, sampling model, and missing models."""
+        theta = np.asarray(theta, dtype=float)
+        blocks = [theta[b] for b in self.blocks]
+        if self.sampling is None:
+            return blocks[0], blocks[1], None, []
+        return blocks[0], blocks[1], blocks[2], blocks[3:]
+
+    def _weights_(self, beta, gammas):
+        """Internal function for the overall inverse probability weight (IPTW x IPMW x IOSW) given the nuisance
+        parameters, on the weighted rows (``self.rows``). Weights are one without a sampling model.
+        """
+        ipw = np.ones(self.rows.shape[0])
+        if self.sampling is None:
+            return ipw
+        pos, X = self.inverse_odds
+        ipw[pos] = np.exp(-np.dot(X, beta))                             # Inverse Odds of Sampling Weights
+        for (pos, X), g in zip(self.weighting, gammas):
+            ipw[pos] /= inverse_logit(np.dot(X, g))                     # Inverse probability of missing weight
+        iptw = 1 / 0.5                                                  # Here, the propensity score is known
+        return iptw * ipw
+
+    def _fitted_(self, j, X, coef, deriv=False):
+        """Internal function for the predicted probabilities (or the derivative of the score, with ``deriv=True``) of
+        the j-th nuisance model (sampling model is 0) at ``coef``. Taken from the cache when ``coef`` is the cached fit.
+        """
+        if self.cache is not None:
+            fit = self.cache.lookup(self.keys[j], coef)
+            if fit is not None:
+                return fit[2] if deriv else fit[1]
+        pred = inverse_logit(np.dot(X, coef))
+        return _logistic_score_deriv_(X=X, pred=pred, subset=1) if deriv else pred
+
+    def _means_(self, ipw):
+        """Internal function for the weighted mean in each arm given the weights on the weighted rows."""
+        return np.array([np.dot(ipw[pos], y) / np.sum(ipw[pos]) for _, pos, y in self.arms])
+
+
+class NaiveSingleSpan(_ArmMeans_):
+    """Naive Single-Span estimator with the data bound once. The estimating functions in ``psi`` are the same as
+    ``ee_naive_ss``, but the subsets and the outcome with missing values set to zero are computed only once, and the
+    object (and its methods) can be pickled for use in worker processes.
+
+    Parameters
+    ----------
+    y : ndarray, list
+        Outcome (allows for binary or continuous)
+    a : ndarray, list
+        Assigned treatment arm
+    r : ndarray, list
+        Population / sample indicator, with 1 being the target and 0 being the non-focal
+    m : ndarray, list
+        Missing indicator for y
+    """
+    def __init__(self, y, a, r, m):
+        self._setup_(y=y, m=m, r=r, **self._spec_(a=a, r=r))
+
+    @staticmethod
+    def _spec_(a, r):
+        """Internal function for the arm subsets and contrasts. Also used with a leading replicate axis."""
+        a, r = np.asarray(a), np.asarray(r)
+        return dict(subsets=(r*(a == 3), (1-r)*(a == 1)),
+                    contrasts=[[1, -1]])
+
+
+class NaiveMultiSpan(_ArmMeans_):
+    """Naive Multi-Span estimator with the data bound once. The estimating functions in ``psi`` are the same as
+    ``ee_naive_ms``. See ``NaiveSingleSpan`` for the parameters.
+    """
+    def __init__(self, y, a, r, m):
+        self._setup_(y=y, m=m, r=r, **self._spec_(a=a, r=r))
+
+    @staticmethod
+    def _spec_(a, r):
+        """Internal function for the arm subsets and contrasts. Also used with a leading replicate axis."""
+        a, r = np.asarray(a), np.asarray(r)
+        return dict(subsets=(r*(a == 3), r*(a == 2), (1-r)*(a == 2), (1-r)*(a == 1)),
+                    contrasts=[[1, -1, 1, -1], [0, 1, -1, 0]])
+
+
+class BridgeSingleSpan(_ArmMeans_):
+    """Bridge Single-Span estimator with the data bound once. The estimating functions in ``psi`` are the same as
+    ``ee_bridge_ss``, but the subsets, the outcome with missing values set to zero, and the design matrices are
+    processed only once, and the object (and its methods) can be pickled for use in worker processes. This estimator
+    assumes that randomization for both trials was 1:1.
+
+    Parameters
+    ----------
+    y : ndarray, list
+        Outcome (allows for binary or continuous)
+    a : ndarray, list
+        Assigned treatment arm
+    r : ndarray, list
+        Population / sample indicator, with 1 being the target and 0 being the non-focal
+    m : ndarray, list
+        Missing indicator for y
+    W : ndarray, list
+        Design matrix for the selection / sampling model
+    V3 : ndarray, list
+        Design matrix for the missing model, restricted to A=3
+    V1 : ndarray, list
+        Design matrix for the missing model, restricted to A=1
+    cache : NuisanceCache, None, optional
+        Cache of fitted nuisance models shared with other estimators on the same data (see ``mestimation``). Default
+        is None, which does not use a cache.
+    """
+    def __init__(self, y, a, r, m, W, V3, V1, cache=None):
+        self._setup_(y=y, m=m, r=r, cache=cache, **self._spec_(a=a, r=r, W=W, V3=V3, V1=V1))
+
+    @staticmethod
+    def _spec_(a, r, W, V3, V1):
+        """Internal function for the arm subsets, contrasts, and nuisance models. Also used with a leading replicate
+        axis.
+        """
+        a, r = np.asarray(a), np.asarray(r)
+        return dict(subsets=(r*(a == 3), (1-r)*(a == 1)),
+                    contrasts=[[1, -1]],
+                    W=W, sampling_subset=(a != 2),
+                    models=((V3, (a == 3), r*(a == 3)),
+                            (V1, (a == 1), (1-r)*(a == 1))))
+
+
+class BridgeMultiSpan(_ArmMeans_):
+    """Bridge Multi-Span estimator with the data bound once. The estimating functions in ``psi`` are the same as
+    ``ee_bridge_ms``. This estimator assumes that randomization for both trials was 1:1.
+
+    Parameters
+    ----------
+    y : ndarray, list
+        Outcome (allows for binary or continuous)
+    a : ndarray, list
+        Assigned treatment arm
+    r : ndarray, list
+        Population / sample indicator, with 1 being the target and 0 being the non-focal
+    m : ndarray, list
+        Missing indicator for y
+    W : ndarray, list
+        Design matrix for the selection / sampling model
+    V3 : ndarray, list
+        Design matrix for the missing model, restricted to A=3
+    V2a : ndarray, list
+        Design matrix for the missing model, restricted to A=2,R=2
+    V2b : ndarray, list
+        Design matrix for the missing model, restricted to A=2,R=1
+    V1 : ndarray, list
+        Design matrix for the missing model, restricted to A=1
+    cache : NuisanceCache, None, optional
+        Cache of fitted nuisance models shared with other estimators on the same data (see ``mestimation``). Default
+        is None, which does not use a cache.
+    """
+    def __init__(self, y, a, r, m, W, V3, V2a, V2b, V1, cache=None):
+        self._setup_(y=y, m=m, r=r, cache=cache, **self._spec_(a=a, r=r, W=W, V3=V3, V2a=V2a, V2b=V2b, V1=V1))
+
+    @staticmethod
+    def _spec_(a, r, W, V3, V2a, V2b, V1):
+        """Internal function for the arm subsets, contrasts, and nuisance models. Also used with a leading replicate
+        axis.
+        """
+        a, r = np.asarray(a), np.asarray(r)
+        return dict(subsets=(r*(a == 3), r*(a == 2), (1-r)*(a == 2), (1-r)*(a == 1)),
+                    contrasts=[[1, -1, 1, -1], [0, 1, -1, 0]],
+                    W=W, sampling_subset=np.ones(a.shape),
+                    models=((V3, (a == 3), r*(a == 3)),
+                            (V2a, r*(a == 2), r*(a == 2)),
+                            (V2b, (1-r)*(a == 2), (1-r)*(a == 2)),
+                            (V1, (1-r)*(a == 1), (1-r)*(a == 1))))
+
+
+def _as_slice_(index):
+    """Internal function that converts an increasing index array to the equivalent slice when it is contiguous."""
+    if index.shape[0] == 0:
+        return slice(0, 0)
+    if index[-1] - index[0] + 1 == index.shape[0]:
+        return slice(int(index[0]), int(index[-1]) + 1)
+    return index
+
+
+def _linear_predictors_(designs, coefs):
+    """Internal function for the linear predictor of each model from its design matrix and parameters. Models given
+    the same design matrix share one matrix product against their stacked parameters. Also used with a leading
+    replicate axis (design matrices of shape (replicate, obs, parameter) and parameters of shape (replicate,
+    parameter)).
+    """
+    predictors = [None] * len(designs)
+    for X, group in _group_designs_(designs):
+        stacked = np.stack([coefs[k] for k in group], axis=-2)                  # (..., model, parameter)
+        product = np.matmul(stacked, np.swapaxes(X, -1, -2))                    # (..., model, obs), rows contiguous
+        for i, k in enumerate(group):
+            predictors[k] = product[..., i, :]
+    return predictors
+
+
+def _group_designs_(designs):
+    """Internal function that groups models by their design matrix, without reading its contents. Models share a
+    design matrix when they are given the same object. Returns each design matrix with the positions of the models
+    that use it. The groups hold references to the given objects, so an ``id`` cannot be reused by another object while
+    grouping (which could happen with temporary copies, e.g., from type conversion).
+    """
+    groups = {}
+    for k, X in enumerate(designs):
+        groups.setdefault(id(X), (X, []))[1].append(k)
+    return list(groups.values())
+
+
+def _logistic_score_deriv_(X, pred, subset):
+    """Internal function for the derivative of the summed logistic regression score, restricted to a subset."""
+    return -np.dot((X * (subset * pred * (1 - pred))[:, None]).T, X)
@@ -8,31 +8,23 @@
 ############################################################################
 # Importing dependencies
 
+from functools import partial
 import numpy as np
 import pandas as pd
-from delicatessen import MEstimator
 
-from efuncs import ee_bridge_ss, ee_bridge_ms
-
-############################################################################
-# Estimating Functions for delicatessen
-
-
-def psi_singlespan(theta):
-    return ee_bridge_ss(theta=theta,
-                        y=y, a=a, r=r, m=m,
-                        W=W, V3=V3, V1=V1)
-
-
-def psi_multispan(theta):
-    return ee_bridge_ms(theta=theta,
-                        y=y, a=a, r=r, m=m,
-                        W=W, V3=V3, V2a=V22, V2b=V21, V1=V1)
+from efuncs import BridgeSingleSpan, BridgeMultiSpan
+from mestimation import AnalyticMEstimator, NuisanceCache, WarmStart, solve_two_stage
 
+# Initial values from the complete-case means and a step of each nuisance model, started from the solution for the
+#   previous population (the number of IRLS iterations of each fit is printed with the results)
+warm_start = WarmStart(reuse=True)
 
 ############################################################################
 # Design Matrices
 
+# Indicators are stored as int8 (those that can be missing keep NaN, so are float), and are converted to float64 only
+#   when the design matrices are built or the data is bound by the estimators (see the storage types in dgm.py)
+
 w_cols = ['intercept', 'male', 'black', 'hispanic', 'idu', 'karnof_cat2', 'karnof_cat3',
           'age_ms_SP1', 'age_ms_SP2', 'age_ms_SP3', 'age_ms_SP4',
           'CD4BL_ms_SP1', 'CD4BL_ms_SP2', 'CD4BL_ms_SP3', 'CD4BL_ms_SP4']
@@ -53,22 +45,21 @@ vs_len = len(vs_cols)
 # Loading Pre-Processed Data
 
 d = pd.read_csv("data/actg_unrestricted.csv")
-d['intercept'] = 1
-d['karnof_cat2'] = np.where(d['karnof_cat'] == 2, 1, np.nan)
-d['karnof_cat2'] = np.where(d['karnof_cat'] != 2, 0, d['karnof_cat2'])
-d['karnof_cat3'] = np.where(d['karnof_cat'] == 3, 1, np.nan)
-d['karnof_cat3'] = np.where(d['karnof_cat'] != 3, 0, d['karnof_cat3'])
+d['intercept'] = np.int8(1)
+d['karnof_cat2'] = np.asarray(d['karnof_cat'] == 2, dtype=np.int8)
+d['karnof_cat3'] = np.asarray(d['karnof_cat'] == 3, dtype=np.int8)
 d['karnof_cat23'] = np.where(d['karnof_cat'] <= 2, 1, np.nan)
 d['karnof_cat23'] = np.where(d['karnof_cat'] > 2, 0, d['karnof_cat23'])
 
 W = np.asarray(d[w_cols])
 V3 = np.asarray(d[vs_cols])
 V21 = np.asarray(d[v_cols])
-V22 = np.asarray(d[v_cols])
-V1 = np.asarray(d[v_cols])
+V22 = V21                                               # Same array for the missing models with the same columns, so
+V1 = V21                                                # ... it is only copied (sorted) once when bound
 a = np.asarray(d['TRT'])
 r = np.asarray(1 - d['ACTG320'])
-m = np.where(d['CD4WK8'].isna(), 0, 1)
+m = np.asarray(d['CD4WK8'].notna(), dtype=np.int8)
+cache = NuisanceCache()                                 # Nuisance models are fit once for all estimators
 
 V = np.asarray(d[v_cols])
 
@@ -78,17 +69,20 @@ V = np.asarray(d[v_cols])
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len
-estrc_ss = MEstimator(psi_singlespan, init=inits)
-estrc_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+inits = warm_start(singlespan, label='SS')
+estrc_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrc_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
+warm_start.update('SS', estrc_ss.theta)
 cic_ss = estrc_ss.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0.5, 0.5, ] + list(estrc_ss.theta[3:])
-estrb_ss = MEstimator(psi_singlespan, init=inits)
-estrb_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+estrb_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrb_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
 cib_ss = estrb_ss.confidence_intervals()
 
 ########################################
@@ -96,17 +90,20 @@ cib_ss = estrb_ss.confidence_intervals()
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 0., 175., 175., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len*3
-estrc_ms = MEstimator(psi_multispan, init=inits)
-estrc_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+inits = warm_start(multispan, label='MS')
+estrc_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrc_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
+warm_start.update('MS', estrc_ms.theta)
 cic_ms = estrc_ms.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0., 0.5, 0.5, 0.5, 0.5, ] + list(estrc_ms.theta[6:])
-estrb_ms = MEstimator(psi_multispan, init=inits)
-estrb_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+estrb_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrb_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
 cib_ms = estrb_ms.confidence_intervals()
 
 ########################################
@@ -126,6 +123,8 @@ print("-------------------------")
 print("SS:   ", np.round(estrb_ss.theta[0], 2), np.round(cib_ss[0, :], 2))
 print("MS:   ", np.round(estrb_ms.theta[0], 2), np.round(cib_ms[0, :], 2))
 print("Diag: ", np.round(estrb_ms.theta[1], 2), np.round(cib_ms[1, :], 2))
+print("-------------------------")
+print("IRLS iterations (SS, MS):", estrc_ss.iterations, estrc_ms.iterations)   # Binary outcome shares the fits
 print("=========================")
 
 
@@ -138,34 +137,38 @@ print("=========================")
 d = pd.read_csv("data/actg_400.csv")
 d['karnof_cat23'] = np.where(d['karnof_cat3'] == 1, 1, 0)
 d['karnof_cat23'] = np.where(d['karnof_cat3'].isna(), np.nan, d['karnof_cat23'])
-d['intercept'] = 1
+d['intercept'] = np.int8(1)
 
 
 W = np.asarray(d[w_cols])
 V3 = np.asarray(d[vs_cols])
 V21 = np.asarray(d[v_cols])
-V22 = np.asarray(d[v_cols])
-V1 = np.asarray(d[v_cols])
+V22 = V21                                               # Same array for the missing models with the same columns, so
+V1 = V21                                                # ... it is only copied (sorted) once when bound
 a = np.asarray(d['TRT'])
 r = np.asarray(1 - d['ACTG320'])
-m = np.where(d['CD4WK8'].isna(), 0, 1)
+m = np.asarray(d['CD4WK8'].notna(), dtype=np.int8)
+cache = NuisanceCache()                                 # Nuisance models are fit once for all estimators
 
 ########################################
 # Single-Span Estimator
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len
-estrc_ss = MEstimator(psi_singlespan, init=inits)
-estrc_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+inits = warm_start(singlespan, label='SS')
+estrc_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrc_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
+warm_start.update('SS', estrc_ss.theta)
 cic_ss = estrc_ss.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0.5, 0.5, ] + list(estrc_ss.theta[3:])
-estrb_ss = MEstimator(psi_singlespan, init=inits)
-estrb_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+estrb_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrb_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
 cib_ss = estrb_ss.confidence_intervals()
 
 ########################################
@@ -173,17 +176,20 @@ cib_ss = estrb_ss.confidence_intervals()
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 0., 175., 175., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len*3
-estrc_ms = MEstimator(psi_multispan, init=inits)
-estrc_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+inits = warm_start(multispan, label='MS')
+estrc_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrc_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
+warm_start.update('MS', estrc_ms.theta)
 cic_ms = estrc_ms.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0., 0.5, 0.5, 0.5, 0.5, ] + list(estrc_ms.theta[6:])
-estrb_ms = MEstimator(psi_multispan, init=inits)
-estrb_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+estrb_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrb_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
 cib_ms = estrb_ms.confidence_intervals()
 
 ########################################
@@ -203,6 +209,8 @@ print("-------------------------")
 print("SS:   ", np.round(estrb_ss.theta[0], 2), np.round(cib_ss[0, :], 2))
 print("MS:   ", np.round(estrb_ms.theta[0], 2), np.round(cib_ms[0, :], 2))
 print("Diag: ", np.round(estrb_ms.theta[1], 2), np.round(cib_ms[1, :], 2))
+print("-------------------------")
+print("IRLS iterations (SS, MS):", estrc_ss.iterations, estrc_ms.iterations)   # Binary outcome shares the fits
 print("=========================")
 
 
@@ -213,39 +221,41 @@ print("=========================")
 # Loading Pre-Processed Data
 
 d = pd.read_csv("data/actg_300.csv")
-d['intercept'] = 1
-d['karnof_cat2'] = np.where(d['karnof_cat'] == 2, 1, np.nan)
-d['karnof_cat2'] = np.where(d['karnof_cat'] != 2, 0, d['karnof_cat2'])
-d['karnof_cat3'] = np.where(d['karnof_cat'] == 3, 1, np.nan)
-d['karnof_cat3'] = np.where(d['karnof_cat'] != 3, 0, d['karnof_cat3'])
+d['intercept'] = np.int8(1)
+d['karnof_cat2'] = np.asarray(d['karnof_cat'] == 2, dtype=np.int8)
+d['karnof_cat3'] = np.asarray(d['karnof_cat'] == 3, dtype=np.int8)
 d['karnof_cat23'] = np.where(d['karnof_cat'] <= 2, 1, np.nan)
 d['karnof_cat23'] = np.where(d['karnof_cat'] > 2, 0, d['karnof_cat23'])
 
 W = np.asarray(d[w_cols])
 V3 = np.asarray(d[vs_cols])
 V21 = np.asarray(d[v_cols])
-V22 = np.asarray(d[v_cols])
-V1 = np.asarray(d[v_cols])
+V22 = V21                                               # Same array for the missing models with the same columns, so
+V1 = V21                                                # ... it is only copied (sorted) once when bound
 a = np.asarray(d['TRT'])
 r = np.asarray(1 - d['ACTG320'])
-m = np.where(d['CD4WK8'].isna(), 0, 1)
+m = np.asarray(d['CD4WK8'].notna(), dtype=np.int8)
+cache = NuisanceCache()                                 # Nuisance models are fit once for all estimators
 
 ########################################
 # Single-Span Estimator
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len
-estrc_ss = MEstimator(psi_singlespan, init=inits)
-estrc_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+inits = warm_start(singlespan, label='SS')
+estrc_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrc_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
+warm_start.update('SS', estrc_ss.theta)
 cic_ss = estrc_ss.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0.5, 0.5, ] + list(estrc_ss.theta[3:])
-estrb_ss = MEstimator(psi_singlespan, init=inits)
-estrb_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+estrb_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrb_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
 cib_ss = estrb_ss.confidence_intervals()
 
 ########################################
@@ -253,17 +263,20 @@ cib_ss = estrb_ss.confidence_intervals()
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 0., 175., 175., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len*3
-estrc_ms = MEstimator(psi_multispan, init=inits)
-estrc_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+inits = warm_start(multispan, label='MS')
+estrc_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrc_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
+warm_start.update('MS', estrc_ms.theta)
 cic_ms = estrc_ms.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0., 0.5, 0.5, 0.5, 0.5, ] + list(estrc_ms.theta[6:])
-estrb_ms = MEstimator(psi_multispan, init=inits)
-estrb_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+estrb_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrb_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
 cib_ms = estrb_ms.confidence_intervals()
 
 ########################################
@@ -283,6 +296,8 @@ print("-------------------------")
 print("SS:   ", np.round(estrb_ss.theta[0], 2), np.round(cib_ss[0, :], 2))
 print("MS:   ", np.round(estrb_ms.theta[0], 2), np.round(cib_ms[0, :], 2))
 print("Diag: ", np.round(estrb_ms.theta[1], 2), np.round(cib_ms[1, :], 2))
+print("-------------------------")
+print("IRLS iterations (SS, MS):", estrc_ss.iterations, estrc_ms.iterations)   # Binary outcome shares the fits
 print("=========================")
 
 
@@ -293,39 +308,41 @@ print("=========================")
 # Loading Pre-Processed Data
 
 d = pd.read_csv("data/actg_200.csv")
-d['intercept'] = 1
-d['karnof_cat2'] = np.where(d['karnof_cat'] == 2, 1, np.nan)
-d['karnof_cat2'] = np.where(d['karnof_cat'] != 2, 0, d['karnof_cat2'])
-d['karnof_cat3'] = np.where(d['karnof_cat'] == 3, 1, np.nan)
-d['karnof_cat3'] = np.where(d['karnof_cat'] != 3, 0, d['karnof_cat3'])
+d['intercept'] = np.int8(1)
+d['karnof_cat2'] = np.asarray(d['karnof_cat'] == 2, dtype=np.int8)
+d['karnof_cat3'] = np.asarray(d['karnof_cat'] == 3, dtype=np.int8)
 d['karnof_cat23'] = np.where(d['karnof_cat'] <= 2, 1, np.nan)
 d['karnof_cat23'] = np.where(d['karnof_cat'] > 2, 0, d['karnof_cat23'])
 
 W = np.asarray(d[w_cols])
 V3 = np.asarray(d[vs_cols])
 V21 = np.asarray(d[v_cols])
-V22 = np.asarray(d[v_cols])
-V1 = np.asarray(d[v_cols])
+V22 = V21                                               # Same array for the missing models with the same columns, so
+V1 = V21                                                # ... it is only copied (sorted) once when bound
 a = np.asarray(d['TRT'])
 r = np.asarray(1 - d['ACTG320'])
-m = np.where(d['CD4WK8'].isna(), 0, 1)
+m = np.asarray(d['CD4WK8'].notna(), dtype=np.int8)
+cache = NuisanceCache()                                 # Nuisance models are fit once for all estimators
 
 ########################################
 # Single-Span Estimator
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len
-estrc_ss = MEstimator(psi_singlespan, init=inits)
-estrc_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+inits = warm_start(singlespan, label='SS')
+estrc_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrc_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
+warm_start.update('SS', estrc_ss.theta)
 cic_ss = estrc_ss.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0.5, 0.5, ] + list(estrc_ss.theta[3:])
-estrb_ss = MEstimator(psi_singlespan, init=inits)
-estrb_ss.estimate(solver="lm", maxiter=20000)
+singlespan = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1, cache=cache)
+estrb_ss = AnalyticMEstimator(singlespan.psi, jacobian=singlespan.jacobian, init=inits)
+estrb_ss.estimate(solver=partial(solve_two_stage, singlespan, full_output=True))
 cib_ss = estrb_ss.confidence_intervals()
 
 ########################################
@@ -333,17 +350,20 @@ cib_ss = estrb_ss.confidence_intervals()
 
 # Continuous
 y = np.asarray(d['CD4WK8'])
-inits = [0., 0., 175., 175., 175., 175., ] + [0., ]*w_len + [0., ]*vs_len + [0., ]*v_len*3
-estrc_ms = MEstimator(psi_multispan, init=inits)
-estrc_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+inits = warm_start(multispan, label='MS')
+estrc_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrc_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
+warm_start.update('MS', estrc_ms.theta)
 cic_ms = estrc_ms.confidence_intervals()
 
 # Binary
 y = np.where(d['CD4WK8'] > 250, 1, 0)
 y = np.where(d['CD4WK8'].isna(), np.nan, y)
 inits = [0., 0., 0.5, 0.5, 0.5, 0.5, ] + list(estrc_ms.theta[6:])
-estrb_ms = MEstimator(psi_multispan, init=inits)
-estrb_ms.estimate(solver="lm", tolerance=1e-12, maxiter=20000)
+multispan = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V22, V2b=V21, V1=V1, cache=cache)
+estrb_ms = AnalyticMEstimator(multispan.psi, jacobian=multispan.jacobian, init=inits)
+estrb_ms.estimate(solver=partial(solve_two_stage, multispan, full_output=True))
 cib_ms = estrb_ms.confidence_intervals()
 
 ########################################
@@ -363,6 +383,8 @@ print("-------------------------")
 print("SS:   ", np.round(estrb_ss.theta[0], 2), np.round(cib_ss[0, :], 2))
 print("MS:   ", np.round(estrb_ms.theta[0], 2), np.round(cib_ms[0, :], 2))
 print("Diag: ", np.round(estrb_ms.theta[1], 2), np.round(cib_ms[1, :], 2))
+print("-------------------------")
+print("IRLS iterations (SS, MS):", estrc_ss.iterations, estrc_ms.iterations)   # Binary outcome shares the fits
 print("=========================")
 
 ############################################################################
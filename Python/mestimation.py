@@ -0,0 +1,1055 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   M-estimation with user-provided derivatives of the estimating functions
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import time
+import hashlib
+import numpy as np
+from scipy.optimize import root
+from scipy.stats import norm
+from delicatessen.utilities import inverse_logit
+
+from efuncs import BridgeSingleSpan, BridgeMultiSpan, _linear_predictors_, _logistic_score_deriv_
+
+
+class AnalyticMEstimator:
+    """M-estimator for stacked estimating functions with a known derivative. Follows the interface of delicatessen's
+    ``MEstimator``, but the provided derivative is used by the root-finding algorithm and for the bread of the sandwich
+    variance, rather than approximating either numerically.
+
+    Parameters
+    ----------
+    stacked_equations : callable
+        Function of ``theta`` that returns the `v`-by-`n` array of the estimating functions
+    jacobian : callable
+        Function of ``theta`` that returns the `v`-by-`v` derivative of the summed estimating functions, e.g.,
+        ``jac_bridge_ss`` with the data bound
+    init : list, set, array
+        Initial values for the root-finding algorithm
+
+    Attributes
+    ----------
+    theta : ndarray
+        Estimated parameters after ``estimate()`` is called
+    variance : ndarray
+        Covariance matrix for the parameters
+    bread : ndarray
+        Bread matrix for the parameter vector
+    meat : ndarray
+        Meat matrix for the parameter vector
+    iterations : int
+        Number of iterations of the root-finding procedure (function evaluations for ``scipy.optimize.root``), or None
+        if a user-provided solver does not report them
+    """
+    def __init__(self, stacked_equations, jacobian, init):
+        self.stacked_equations = stacked_equations
+        self.jacobian = jacobian
+        self.init = np.asarray(init, dtype=float)
+        self.theta = None
+        self.bread = None
+        self.meat = None
+        self.variance = None
+        self.n_obs = None
+        self.iterations = None
+
+    def estimate(self, solver='lm', maxiter=5000, tolerance=1e-9, budget=None):
+        """Run the point and variance estimation procedures.
+
+        Parameters
+        ----------
+        solver : str, callable, optional
+            Root-finding algorithm in ``scipy.optimize.root`` that accepts a Jacobian. Default is ``'lm'``. Otherwise,
+            a function of the initial values that returns the solved parameters (or the parameters and the number of
+            iterations), e.g., ``solve_bridge_ss`` with the data bound. In that case, only the sandwich variance is
+            computed here.
+        maxiter : int, optional
+            Maximum number of function evaluations for the root-finding procedure. Default is 5000.
+        tolerance : float, optional
+            Tolerance for the root-finding procedure. Default is 1e-9.
+        budget : SolverBudget, None, optional
+            Budget that is checked at each evaluation of the estimating functions or their derivative (and before and
+            after a user-provided solver), which raises ``BudgetExceeded`` once it is used up. Default is None.
+
+        Returns
+        -------
+        None
+        """
+        equations, jacobian = self.stacked_equations, self.jacobian
+        if budget is not None:                                  # Checking the budget at each evaluation
+            equations, jacobian = budget.wrap(equations), budget.wrap(jacobian)
+            budget.check()
+        if callable(solver):                                    # User-provided solver
+            solved = solver(self.init)
+            if isinstance(solved, tuple):                           # ... that reports its iterations
+                solved, self.iterations = solved
+            self.theta = np.asarray(solved, dtype=float)
+            if budget is not None:
+                budget.check()
+            self.sandwich()
+            return
+
+        opt = root(lambda theta: np.sum(equations(theta=theta), axis=1),
+                   x0=self.init, jac=lambda theta: jacobian(theta=theta),
+                   method=solver, tol=tolerance,
+                   options={"maxiter": maxiter} if solver == 'lm' else {"maxfev": maxiter})
+        self.iterations = opt.nfev
+        if not opt.success:                                     # Same error handling as delicatessen
+            raise RuntimeError(opt.message)
+        self.theta = opt.x
+        self.sandwich()
+
+    def sandwich(self):
+        """Compute the empirical sandwich variance at the current ``theta``, with the bread from the derivative."""
+        ef = np.asarray(self.stacked_equations(theta=self.theta))
+        self.n_obs = ef.shape[1]
+        self.bread = -1 * self.jacobian(theta=self.theta) / self.n_obs
+        self.meat = np.dot(ef, ef.T) / self.n_obs
+        bread_invert = np.linalg.pinv(self.bread)
+        self.variance = np.dot(np.dot(bread_invert, self.meat), bread_invert.T) / self.n_obs
+
+    def confidence_intervals(self, alpha=0.05):
+        """Wald-type confidence intervals for the parameters.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            The 1 - alpha confidence level. Default is 0.05.
+
+        Returns
+        -------
+        ndarray
+        """
+        z = norm.ppf(1 - alpha / 2)
+        se = np.sqrt(np.diag(self.variance))
+        return np.column_stack([self.theta - z*se, self.theta + z*se])
+
+
+class BatchedMEstimator:
+    """M-estimator that solves the same stacked estimating functions for many replicate data sets at once. Every
+    replicate has the same parameter layout and number of observations, so the Newton-Raphson steps for all replicates
+    are taken together with batched linear algebra, and replicates are dropped from the active set once they converge.
+    The nuisance models do not depend on the means, so the steps are taken for the logistic models (a block-diagonal
+    derivative), after which the means and contrasts are solved directly since their estimating functions are linear.
+    Several outcomes measured on the same observations (e.g., the continuous and binary outcomes) can be estimated
+    together. The nuisance models, weights, and their parts of the sandwich are then computed once and shared, and
+    each outcome has its own means, contrasts, and sandwich variance (the same as estimating it alone).
+
+    Parameters
+    ----------
+    estimator : class
+        Estimator class from ``efuncs`` (``NaiveSingleSpan``, ``NaiveMultiSpan``, ``BridgeSingleSpan``, or
+        ``BridgeMultiSpan``) that defines the estimating functions
+    init : list, set, array
+        Initial values for the root-finding algorithm, shared by all replicates or one row per replicate. Only the
+        values for the nuisance models are used, since the means and contrasts are solved directly
+    y : ndarray
+        Outcome for each replicate, with shape (replicates, observations), or several outcomes with shape (outcomes,
+        replicates, observations)
+    m : ndarray
+        Missing indicator for y for each replicate
+    cache : NuisanceCache, None, optional
+        Cache of fitted nuisance models shared with other estimators on the same replicates. Default is None, which
+        does not use a cache.
+    compress : bool, optional
+        Whether the Newton-Raphson steps of each logistic model run over the unique (design row, outcome) patterns of
+        each replicate, with the number of rows as frequency weights, instead of over every row. Models with nearly as
+        many patterns as rows (e.g., a continuous covariate) are not compressed. The estimates are the same up to
+        rounding, and the sandwich variance is computed from every row. Default is False.
+    **data :
+        Remaining arguments of the estimator class (``a``, ``r``, and the design matrices), each with a leading
+        replicate axis
+
+    Attributes
+    ----------
+    theta : ndarray
+        Estimated parameters for each replicate after ``estimate()`` is called (NaN if not converged), with a leading
+        outcome axis for several outcomes
+    variance : ndarray
+        Covariance matrix for the parameters of each replicate (NaN if not converged), with a leading outcome axis for
+        several outcomes
+    converged : ndarray
+        Whether the root-finding converged for each replicate
+    iterations : ndarray
+        Number of Newton-Raphson steps for each replicate, counting the steps of nuisance models taken from the cache
+        (so each estimator and outcome reports the steps of its own solution)
+    """
+    def __init__(self, estimator, init, y, m, cache=None, compress=False, **data):
+        spec = estimator._spec_(**data)
+        m = np.asarray(m, dtype=float)
+        self.n_reps, self.n_obs = m.shape
+        self.cache = cache
+        self.compress = compress
+        self.contrasts = np.asarray(spec['contrasts'], dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.n_outcomes = None if y.ndim == 2 else y.shape[0]                           # None for a single outcome
+        y = np.nan_to_num(y.reshape((-1, ) + m.shape), copy=True, nan=0.)               # Missing y to 0
+        observed = np.asarray(spec['subsets'], dtype=float) * m                          # Observed in each arm
+        self.data = {'y': np.ascontiguousarray(np.swapaxes(y, 0, 1)),                    # (replicate, outcome, obs)
+                     'observed': np.ascontiguousarray(np.swapaxes(observed, 0, 1))}      # (replicate, arm, obs)
+
+        # Nuisance models: sampling model is 0, then each missing model. Design matrices, outcomes, and the subsets
+        #   that contribute to the model or use it for the weights
+        self.n_models = 0
+        sizes = [self.contrasts.shape[0], self.contrasts.shape[1]]
+        if spec.get('W') is not None:
+            r = np.asarray(data['r'], dtype=float)
+            models = [(spec['W'], 1 - r, spec['sampling_subset'], None)]
+            models += [(V, m, ms, ws) for V, ms, ws in spec['models']]
+            no_model = np.ones(m.shape)
+            for j, (X, outcome, subset, weight_subset) in enumerate(models):
+                self.data['X%i' % j] = np.asarray(X, dtype=float)
+                self.data['outcome%i' % j] = np.asarray(outcome, dtype=float)
+                self.data['subset%i' % j] = np.asarray(subset, dtype=float) * np.ones(m.shape)
+                if weight_subset is not None:
+                    self.data['weight%i' % j] = np.asarray(weight_subset, dtype=float)
+                    no_model = no_model - self.data['weight%i' % j]
+                sizes.append(self.data['X%i' % j].shape[2])
+            self.data.update({'r': r, 'm': m, 'no_model': no_model})
+            self.n_models = len(models)
+        self.keys = []
+        if cache is not None:
+            self.keys = [cache.key(self.data['X%i' % j], self.data['outcome%i' % j], self.data['subset%i' % j])
+                         for j in range(self.n_models)]
+        self.blocks = [slice(start, stop) for start, stop in zip(np.cumsum([0] + sizes[:-1]), np.cumsum(sizes))]
+        self.n_params = int(np.sum(sizes))
+        self.init = np.broadcast_to(np.asarray(init, dtype=float), (self.n_reps, self.n_params)).copy()
+        self.theta = None
+        self.variance = None
+        self.converged = None
+        self.iterations = None
+
+    def estimate(self, maxiter=100, tolerance=1e-9):
+        """Run the point and variance estimation procedures for all replicates.
+
+        Parameters
+        ----------
+        maxiter : int, optional
+            Maximum number of Newton-Raphson steps. Default is 100.
+        tolerance : float, optional
+            Convergence tolerance for the largest step, relative to the size of the parameter. Default is 1e-9.
+
+        Returns
+        -------
+        None
+        """
+        theta = self.init.copy()
+        self.converged = np.ones(self.n_reps, dtype=bool)
+        self.iterations = np.zeros(self.n_reps, dtype=int)
+
+        # Nuisance models already fit by another estimator sharing the cache
+        models = list(range(self.n_models))
+        if self.cache is not None:
+            for j in range(self.n_models):
+                if self.keys[j] in self.cache.fits:
+                    coef, converged = self.cache.fits[self.keys[j]]
+                    theta[:, self.blocks[2 + j]] = coef
+                    self.converged &= converged
+                    self.iterations = np.maximum(self.iterations, self.cache.iterations[self.keys[j]])
+                    models.remove(j)
+
+        # Newton-Raphson steps for the remaining nuisance models, over the unique patterns of each model's rows when
+        #   compressed
+        if len(models) > 0:
+            fitted = np.zeros(self.n_reps, dtype=bool)
+            nuisance = np.concatenate([np.arange(self.blocks[2 + j].start, self.blocks[2 + j].stop) for j in models])
+            active = np.arange(self.n_reps)                                 # Replicates still being solved
+            data = {}
+            for j in models:
+                patterns = None
+                if self.compress:
+                    patterns = _patterns_(self.data['X%i' % j], self.data['outcome%i' % j], self.data['subset%i' % j])
+                if patterns is None:
+                    patterns = self.data['X%i' % j], self.data['outcome%i' % j], self.data['subset%i' % j]
+                data['X%i' % j], data['outcome%i' % j], data['subset%i' % j] = patterns
+            steps = np.zeros(self.n_reps, dtype=int)
+            for i in range(maxiter):
+                step, failed = self._nuisance_step_(data=data, theta=theta[active], models=models)
+                theta[active[:, None], nuisance] += step
+                steps[active] += 1
+                done = np.max(np.abs(step) / (1 + np.abs(theta[active[:, None], nuisance])), axis=1) < tolerance
+                fitted[active[done & ~failed]] = True
+                keep = ~(done | failed)
+                if not np.any(keep):
+                    break
+                if not np.all(keep):                                        # Dropping replicates from active set
+                    active = active[keep]
+                    data = _take_(data, keep)
+            self.converged &= fitted
+            self.iterations = np.maximum(self.iterations, steps)           # Steps are taken jointly for the models
+            if self.cache is not None:
+                for j in models:
+                    self.cache.fits[self.keys[j]] = (theta[:, self.blocks[2 + j]].copy(), fitted)
+                    self.cache.iterations[self.keys[j]] = steps
+
+        # Means and contrasts, then the sandwich variance for the converged replicates, for each outcome. The weights
+        #   and the nuisance models' parts of the sandwich do not depend on the outcome
+        theta[~self.converged] = np.nan
+        n_outcomes = self.data['y'].shape[1]
+        thetas = np.repeat(theta[None, :, :], n_outcomes, axis=0)
+        self.variance = np.full((n_outcomes, self.n_reps, self.n_params, self.n_params), np.nan)
+        done = np.flatnonzero(self.converged)
+        if done.shape[0] > 0:
+            data = self.data if done.shape[0] == self.n_reps else _take_(self.data, done)
+            weights = self._weights_(data=data, theta=theta[done])
+            nuisance = self._nuisance_evaluate_(data=data, theta=theta[done])
+            total = np.sum(weights, axis=2)
+            for k in range(n_outcomes):
+                y = data['y'][:, k, :]
+                mu = np.sum(weights * y[:, None, :], axis=2) / total
+                thetas[k, done, self.blocks[1]] = mu
+                thetas[k, done, self.blocks[0]] = np.dot(mu, self.contrasts.T)
+                ef, jac = self._evaluate_(data=data, theta=thetas[k, done], weights=weights, y=y, nuisance=nuisance)
+                bread = -1 * jac / self.n_obs
+                meat = np.matmul(ef, np.swapaxes(ef, 1, 2)) / self.n_obs
+                bread_invert = np.linalg.pinv(bread)
+                self.variance[k, done] = np.matmul(np.matmul(bread_invert, meat),
+                                                   np.swapaxes(bread_invert, 1, 2)) / self.n_obs
+        if self.n_outcomes is None:
+            thetas, self.variance = thetas[0], self.variance[0]
+        self.theta = thetas
+
+    def confidence_intervals(self, alpha=0.05):
+        """Wald-type confidence intervals for the parameters of each replicate.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            The 1 - alpha confidence level. Default is 0.05.
+
+        Returns
+        -------
+        ndarray :
+            Array with shape (replicates, parameters, 2), with a leading outcome axis for several outcomes
+        """
+        z = norm.ppf(1 - alpha / 2)
+        se = np.sqrt(np.diagonal(self.variance, axis1=-2, axis2=-1))
+        return np.stack([self.theta - z*se, self.theta + z*se], axis=-1)
+
+    def _nuisance_step_(self, data, theta, models):
+        """Internal function for the Newton-Raphson step of the listed logistic nuisance models (sampling model is 0) of
+        a set of replicates. Models with the same design matrix share one matrix product for the linear predictors.
+        """
+        steps, failed = [], np.zeros(theta.shape[0], dtype=bool)
+        predictors = _linear_predictors_([data['X%i' % j] for j in models],
+                                         [theta[:, self.blocks[2 + j]] for j in models])
+        for j, predictor in zip(models, predictors):
+            pred = inverse_logit(predictor)
+            score = np.matmul((data['subset%i' % j] * (data['outcome%i' % j] - pred))[:, None, :], data['X%i' % j])
+            info = _weighted_gram_(data['X%i' % j], data['subset%i' % j] * pred * (1 - pred))
+            step, fail = _batched_solve_(info, score[:, 0, :])
+            steps.append(step)
+            failed = failed | fail
+        return np.concatenate(steps, axis=1), failed
+
+    def _weights_(self, data, theta):
+        """Internal function for the weight of each observation in each arm mean, with shape (replicate, arm, obs). For
+        the bridge estimators, these are the inverse probability weights (IPTW x IPMW x IOSW).
+        """
+        if self.n_models == 0:
+            return data['observed']
+        predictors = _linear_predictors_([data['X%i' % j] for j in range(self.n_models)],
+                                         [theta[:, b] for b in self.blocks[2:]])
+        iosw = data['r'] + (1-data['r'])*np.exp(-predictors[0])            # Inverse Odds of Sampling Weights
+        pr_m = data['no_model'].copy()
+        for j in range(1, self.n_models):
+            pr_m += data['weight%i' % j] * inverse_logit(predictors[j])
+        iptw = 1 / 0.5                                                      # Here, the propensity score is known
+        return data['observed'] * (iptw * data['m'] / pr_m * iosw)[:, None, :]
+
+    def _nuisance_evaluate_(self, data, theta):
+        """Internal function for the parts of the sandwich that do not depend on the outcome: the estimating functions
+        of the nuisance models, their summed derivative, and the derivative of the log-weight with respect to each
+        nuisance model (-W for the IOSW of R=0, and -(1 - Pr(M=1)) V for the IPMW), for a set of replicates.
+        """
+        start = self.blocks[1].stop
+        ef = np.empty((theta.shape[0], self.n_params - start, self.n_obs))
+        jac = np.zeros((theta.shape[0], self.n_params - start, self.n_params - start))
+        log_weight = []
+        predictors = _linear_predictors_([data['X%i' % j] for j in range(self.n_models)],
+                                         [theta[:, b] for b in self.blocks[2:]])
+        for j, b in enumerate(self.blocks[2:]):
+            X = data['X%i' % j]
+            pred = inverse_logit(predictors[j])
+            local = slice(b.start - start, b.stop - start)                  # Position within the nuisance blocks
+            ef[:, local] = (data['subset%i' % j] * (data['outcome%i' % j] - pred))[:, None, :] * np.swapaxes(X, 1, 2)
+            jac[:, local, local] = -_weighted_gram_(X, data['subset%i' % j] * pred * (1 - pred))
+            if j == 0:
+                log_weight.append(-(1-data['r'])[:, None, :])
+            else:
+                log_weight.append(-(data['weight%i' % j]*(1-pred))[:, None, :])
+        return ef, jac, log_weight
+
+    def _evaluate_(self, data, theta, weights, y, nuisance):
+        """Internal function for the stacked estimating functions of each observation, with shape (replicate,
+        parameter, obs), and their summed derivative, with shape (replicate, parameter, parameter), for a set of
+        replicates and one outcome.
+        """
+        bc, bm, bn = self.blocks[0], self.blocks[1], slice(self.blocks[1].stop, self.n_params)
+        mu = theta[:, bm]
+        ef = np.empty((theta.shape[0], self.n_params, self.n_obs))
+        jac = np.zeros((theta.shape[0], self.n_params, self.n_params))
+
+        # ATE and diagnostic
+        ef[:, bc] = (np.dot(mu, self.contrasts.T) - theta[:, bc])[:, :, None]
+        jac[:, bc, bc] = -self.n_obs * np.identity(self.contrasts.shape[0])
+        jac[:, bc, bm] = self.n_obs * self.contrasts
+
+        # Means in each arm
+        ef[:, bm] = weights * (y[:, None, :] - mu[:, :, None])
+        diag = np.arange(bm.start, bm.stop)
+        jac[:, diag, diag] = -np.sum(weights, axis=2)
+
+        # Nuisance models, and the derivative of the means with respect to them (estimating function times the
+        #   derivative of the log-weight)
+        ef[:, bn], jac[:, bn, bn], log_weight = nuisance
+        for j, b in enumerate(self.blocks[2:]):
+            jac[:, bm, b] = np.matmul(ef[:, bm] * log_weight[j], data['X%i' % j])
+        return ef, jac
+
+
+class ChunkedMEstimator:
+    """M-estimator for data sets too large to evaluate at once, e.g., pooled trials with millions of rows stored as
+    memory-mapped arrays. The rows are split into chunks, and the estimator class from ``efuncs`` is bound to one chunk
+    at a time. Only sums over the rows are kept: the summed estimating functions and their derivative for the
+    Newton-Raphson steps, then the bread and the meat (the sum of the outer products of the estimating functions) for
+    the sandwich variance. Peak memory then depends on ``chunk_size`` rather than the number of observations, and the
+    estimates and variance are the same as for ``AnalyticMEstimator`` (up to rounding).
+
+    Parameters
+    ----------
+    estimator : class
+        Estimator class from ``efuncs`` (``NaiveSingleSpan``, ``NaiveMultiSpan``, ``BridgeSingleSpan``, or
+        ``BridgeMultiSpan``) that defines the estimating functions
+    init : list, set, array
+        Initial values for the root-finding algorithm
+    chunk_size : int, optional
+        Number of rows in each chunk. Default is 100000.
+    **data :
+        Arguments of the estimator class (e.g., ``y``, ``a``, ``r``, ``m``, and the design matrices) with the
+        observations on the first axis. Memory-mapped arrays (e.g., from ``np.load(path, mmap_mode='r')``) are only
+        read one chunk at a time.
+
+    Attributes
+    ----------
+    theta : ndarray
+        Estimated parameters after ``estimate()`` is called
+    variance : ndarray
+        Covariance matrix for the parameters
+    bread : ndarray
+        Bread matrix for the parameter vector
+    meat : ndarray
+        Meat matrix for the parameter vector
+    iterations : int
+        Number of Newton-Raphson steps (each one pass over the chunks)
+    """
+    def __init__(self, estimator, init, chunk_size=100000, **data):
+        self.estimator = estimator
+        self.init = np.asarray(init, dtype=float)
+        self.chunk_size = chunk_size
+        self.data = data
+        self.n_obs = np.shape(data['m'])[0]
+        self.theta = None
+        self.bread = None
+        self.meat = None
+        self.variance = None
+        self.iterations = None
+
+    def estimate(self, maxiter=100, tolerance=1e-9):
+        """Run the point and variance estimation procedures, with one pass over the chunks for each Newton-Raphson
+        step and one for the sandwich variance.
+
+        Parameters
+        ----------
+        maxiter : int, optional
+            Maximum number of Newton-Raphson steps. Default is 100.
+        tolerance : float, optional
+            Convergence tolerance for the largest step, relative to the size of the parameter. Default is 1e-9.
+
+        Returns
+        -------
+        None
+        """
+        theta = self.init.copy()
+        for i in range(maxiter):
+            ef_sum, jac, _ = self._sums_(theta=theta)
+            try:
+                step = np.linalg.solve(jac, -ef_sum)
+            except np.linalg.LinAlgError:
+                raise RuntimeError("Singular derivative of the estimating functions")
+            if not np.all(np.isfinite(step)):
+                raise RuntimeError("Non-finite Newton-Raphson step")
+            theta = theta + step
+            if np.max(np.abs(step) / (1 + np.abs(theta))) < tolerance:
+                self.iterations = i + 1
+                break
+        else:
+            raise RuntimeError("Newton-Raphson failed to converge")
+        self.theta = theta
+
+        # Sandwich variance from the summed derivative and outer products
+        _, jac, outer = self._sums_(theta=theta, meat=True)
+        self.bread = -1 * jac / self.n_obs
+        self.meat = outer / self.n_obs
+        bread_invert = np.linalg.pinv(self.bread)
+        self.variance = np.dot(np.dot(bread_invert, self.meat), bread_invert.T) / self.n_obs
+
+    def confidence_intervals(self, alpha=0.05):
+        """Wald-type confidence intervals for the parameters.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            The 1 - alpha confidence level. Default is 0.05.
+
+        Returns
+        -------
+        ndarray
+        """
+        z = norm.ppf(1 - alpha / 2)
+        se = np.sqrt(np.diag(self.variance))
+        return np.column_stack([self.theta - z*se, self.theta + z*se])
+
+    def _sums_(self, theta, meat=False):
+        """Internal function for the summed estimating functions, their summed derivative, and (with ``meat``) the sum
+        of their outer products over all chunks.
+        """
+        ef_sum, jac, outer = 0., 0., 0.
+        for start in range(0, self.n_obs, self.chunk_size):
+            rows = slice(start, min(start + self.chunk_size, self.n_obs))
+            chunk = self.estimator(**{key: np.asarray(value[rows]) for key, value in self.data.items()})
+            ef = chunk.psi(theta)
+            ef_sum = ef_sum + np.sum(ef, axis=1)
+            jac = jac + chunk.jacobian(theta)
+            if meat:
+                outer = outer + np.dot(ef, ef.T)
+        return ef_sum, jac, outer
+
+
+class NaiveDirectEstimator:
+    """Direct (closed-form) estimator for the naive estimators. The arm means are complete-case means and the average
+    treatment effect and diagnostic are linear contrasts of them, so the root of the stacked estimating functions and
+    the exact sandwich variance only need the count, sum, and sum of squared deviations of the outcome in each arm.
+    These are computed with grouped sums (``np.bincount``), for a single data set or for a stack of replicates.
+
+    Parameters
+    ----------
+    estimator : class
+        Naive estimator class from ``efuncs`` (``NaiveSingleSpan`` or ``NaiveMultiSpan``) that defines the arm subsets
+        and contrasts
+    y : ndarray
+        Outcome, with an optional leading replicate axis
+    m : ndarray
+        Missing indicator for y
+    **data :
+        Remaining arguments of the estimator class (``a``, ``r``)
+
+    Attributes
+    ----------
+    theta : ndarray
+        Estimated parameters after ``estimate()`` is called, in the same order as the estimating functions
+    variance : ndarray
+        Covariance matrix for the parameters
+    converged : ndarray, bool
+        Whether every arm has an observed outcome (otherwise the parameters are NaN, or a RuntimeError is raised for a
+        single data set)
+    """
+    def __init__(self, estimator, y, m, **data):
+        spec = estimator._spec_(**data)
+        self.stacked = np.ndim(m) == 2                                  # Leading replicate axis
+        m = np.atleast_2d(np.asarray(m, dtype=float))
+        self.y = np.nan_to_num(np.atleast_2d(np.asarray(y, dtype=float)), copy=True, nan=0.)
+        self.contrasts = np.asarray(spec['contrasts'], dtype=float)
+        observed = np.asarray(spec['subsets'], dtype=bool).reshape((-1, ) + m.shape) & (m != 0)
+
+        # Group of each observation: arm (subsets do not overlap), or one extra group for the unused rows, offset by
+        #   the replicate so that a single bincount covers all replicates
+        n_groups = observed.shape[0] + 1
+        arm = np.where(np.any(observed, axis=0), np.argmax(observed, axis=0), n_groups - 1)
+        self.groups = (arm + n_groups*np.arange(m.shape[0])[:, None]).ravel()
+        self.shape = (m.shape[0], n_groups)
+        self.n_obs = m.shape[1]
+        self.theta = None
+        self.variance = None
+        self.converged = None
+
+    def estimate(self):
+        """Compute the parameters and their sandwich variance.
+
+        Returns
+        -------
+        None
+        """
+        y = self.y.ravel()
+        size = self.shape[0] * self.shape[1]
+        count = np.bincount(self.groups, minlength=size).reshape(self.shape)[:, :-1]
+        mu = np.bincount(self.groups, weights=y, minlength=size).reshape(self.shape)[:, :-1] / count
+        deviation = y - np.concatenate([mu, np.zeros((self.shape[0], 1))], axis=1).ravel()[self.groups]
+        sum_sq = np.bincount(self.groups, weights=deviation**2, minlength=size).reshape(self.shape)[:, :-1]
+
+        # Sandwich variance: bread is diag(count) / n and meat is diag(sum_sq) / n for the means, so the means have
+        #   variance sum_sq / count^2 (and are independent), which carries to the contrasts
+        var_mu = sum_sq / count**2
+        cov_mu = var_mu[:, None, :] * self.contrasts                    # Cov(contrasts, mu)
+        var_contrast = np.matmul(cov_mu, self.contrasts.T)
+        self.theta = np.concatenate([np.dot(mu, self.contrasts.T), mu], axis=1)
+        self.variance = np.concatenate([np.concatenate([var_contrast, cov_mu], axis=2),
+                                        np.concatenate([np.swapaxes(cov_mu, 1, 2),
+                                                        var_mu[:, :, None] * np.identity(mu.shape[1])], axis=2)],
+                                       axis=1)
+        self.converged = np.all(count > 0, axis=1)
+        self.theta[~self.converged] = np.nan
+        self.variance[~self.converged] = np.nan
+        if not self.stacked:                                            # Single data set
+            self.theta, self.variance, self.converged = self.theta[0], self.variance[0], self.converged[0]
+            if not self.converged:                                      # Same error handling as delicatessen
+                raise RuntimeError("No observed outcomes in an arm")
+
+    def confidence_intervals(self, alpha=0.05):
+        """Wald-type confidence intervals for the parameters.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            The 1 - alpha confidence level. Default is 0.05.
+
+        Returns
+        -------
+        ndarray
+        """
+        z = norm.ppf(1 - alpha / 2)
+        se = np.sqrt(np.diagonal(self.variance, axis1=-2, axis2=-1))
+        return np.stack([self.theta - z*se, self.theta + z*se], axis=-1)
+
+
+class NuisanceCache:
+    """Cache of fitted logistic nuisance models, shared between estimators applied to the same data (Single-Span and
+    Multi-Span, continuous and binary outcomes). Models are keyed by a hash of the data they are fit to, i.e., the
+    design matrix and outcome on the rows that contribute (and the subset, for stacked replicates), so a model with the
+    same specification and data is only fit once. For a single data set, the predicted probabilities and derivative of
+    the score at the fit are kept too, and are reused by the estimating functions and their derivative. Each estimator
+    still stacks all of its nuisance models, so the sandwich variance is unchanged.
+
+    Attributes
+    ----------
+    fits : dict
+        Fitted models by key: coefficients, predicted probabilities, and derivative of the score for a single data set,
+        or coefficients and convergence flags for stacked replicates (``BatchedMEstimator``)
+    iterations : dict
+        Number of IRLS iterations of each model by key, including any steps for its starting values (see
+        ``WarmStart``), or of the joint Newton-Raphson steps of each replicate for stacked replicates
+    """
+    def __init__(self):
+        self.fits = {}
+        self.iterations = {}
+
+    @staticmethod
+    def key(*arrays):
+        """Key for a nuisance model from the shape and contents of its data arrays.
+
+        Parameters
+        ----------
+        *arrays : ndarray
+            Data arrays that define the model
+
+        Returns
+        -------
+        str
+        """
+        digest = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array, dtype=float)
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def fit(self, X, y, key, init=None, full_output=False, compress=False):
+        """Coefficients of the logistic model, fit with ``irls_logistic`` only if the model is not already cached.
+
+        Parameters
+        ----------
+        X : ndarray
+            Design matrix on the rows that contribute to the model
+        y : ndarray
+            Binary outcome on the rows that contribute to the model
+        key : str
+            Key of the model, see ``NuisanceCache.key``
+        init : ndarray, None, optional
+            Starting values. Default is None, which starts at zero.
+        full_output : bool, optional
+            Whether to also return the number of iterations of the model (those of the earlier fit for a cached model,
+            and any steps for its starting values). Default is False.
+        compress : bool, optional
+            Whether to fit over the unique patterns of the rows, see ``irls_logistic``. Default is False.
+
+        Returns
+        -------
+        ndarray, or ndarray and int with ``full_output``
+        """
+        if key not in self.fits:
+            beta, iterations = irls_logistic(X=X, y=y, init=init, full_output=True, compress=compress)
+            pred = inverse_logit(np.dot(X, beta))
+            self.fits[key] = (beta, pred, _logistic_score_deriv_(X=X, pred=pred, subset=1))
+            self.iterations[key] = self.iterations.get(key, 0) + iterations
+        if full_output:
+            return self.fits[key][0], self.iterations[key]
+        return self.fits[key][0]
+
+    def lookup(self, key, coef):
+        """Cached fit (coefficients, predicted probabilities, and derivative of the score) when ``coef`` are the cached
+        coefficients, otherwise None.
+
+        Parameters
+        ----------
+        key : str
+            Key of the model, see ``NuisanceCache.key``
+        coef : ndarray
+            Coefficients the model is evaluated at
+
+        Returns
+        -------
+        tuple, None
+        """
+        fit = self.fits.get(key)
+        if fit is not None and np.array_equal(fit[0], coef):
+            return fit
+        return None
+
+
+class WarmStart:
+    """Initial values for the estimator classes in ``efuncs`` from cheap closed-form pieces: the complete-case mean of
+    each arm subset (and the contrasts of them), and one Newton-Raphson (IRLS) step for each logistic nuisance model.
+    The step starts from zero or, with ``reuse``, from the last solution passed to ``update`` under the same label
+    (e.g., the previous replicate of the same scenario). Models already fit in the estimator's ``NuisanceCache`` start
+    from that fit, without a step. The steps are IRLS iterations like any other, so they are counted: in ``iterations``,
+    and in the cache's count for the model (which the solvers report).
+
+    Parameters
+    ----------
+    reuse : bool, optional
+        Whether to start the nuisance models from the previous solution. Default is True.
+
+    Attributes
+    ----------
+    previous : dict
+        Last solution by label
+    iterations : int
+        Number of IRLS steps taken by the last call
+    """
+    def __init__(self, reuse=True):
+        self.reuse = reuse
+        self.previous = {}
+        self.iterations = 0
+
+    def __call__(self, estimator, label=None):
+        """Initial values for an estimator.
+
+        Parameters
+        ----------
+        estimator : BridgeSingleSpan, BridgeMultiSpan, NaiveSingleSpan, NaiveMultiSpan
+            Estimator with the data bound
+        label : str, None, optional
+            Label of the previous solution to start from, see ``update``. Default is None.
+
+        Returns
+        -------
+        ndarray
+        """
+        mu = estimator._means_(np.ones(estimator.rows.shape[0]))       # Complete-case means
+        init = [np.dot(estimator.contrasts, mu), mu]
+        self.iterations = 0
+        if estimator.sampling is not None:
+            previous = self.previous.get(label) if self.reuse else None
+            if previous is None:
+                starts = [np.zeros(X.shape[1]) for _, X, _ in [estimator.sampling] + estimator.models]
+            else:
+                _, _, beta, gammas = estimator._unpack_(previous)
+                starts = [beta] + gammas
+            cache = estimator.cache
+            for j, ((_, X, outcome), start) in enumerate(zip([estimator.sampling] + estimator.models, starts)):
+                if cache is not None and estimator.keys[j] in cache.fits:   # Already fit by an estimator sharing it
+                    init.append(cache.fits[estimator.keys[j]][0])
+                    continue
+                step = _irls_step_(X=X, y=outcome, weight=1, beta=start)
+                init.append(start if step is None else start + step)
+                self.iterations += 1
+                if cache is not None:                                   # Counted with the model's fit
+                    cache.iterations[estimator.keys[j]] = cache.iterations.get(estimator.keys[j], 0) + 1
+        return np.concatenate(init)
+
+    def update(self, label, theta):
+        """Keep a solution to start from, when it is finite.
+
+        Parameters
+        ----------
+        label : str
+            Label of the solution, e.g., the estimator
+        theta : ndarray
+            Solved parameters
+
+        Returns
+        -------
+        None
+        """
+        theta = np.asarray(theta, dtype=float)
+        if np.all(np.isfinite(theta)):
+            self.previous[label] = theta
+
+
+class SolverBudget:
+    """Wall-clock and evaluation budget for the root-finding of one estimator in one replicate, shared by all of its
+    attempts (see ``AnalyticMEstimator.estimate``). ``check`` is called at each evaluation and raises
+    ``BudgetExceeded`` once either budget is used up, so a badly conditioned replicate costs a bounded amount of time.
+    The clock starts when the budget is created.
+
+    Parameters
+    ----------
+    seconds : float, None, optional
+        Wall-clock budget in seconds. Default is None, which has no time limit.
+    evaluations : int, None, optional
+        Budget for the number of evaluations. Default is None, which has no limit.
+
+    Attributes
+    ----------
+    count : int
+        Number of evaluations so far
+    """
+    def __init__(self, seconds=None, evaluations=None):
+        self.seconds = seconds
+        self.evaluations = evaluations
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def check(self):
+        """Count an evaluation, and raise ``BudgetExceeded`` if the budget is used up.
+
+        Returns
+        -------
+        None
+        """
+        self.count += 1
+        if self.evaluations is not None and self.count > self.evaluations:
+            raise BudgetExceeded("Used up the budget of " + str(self.evaluations) + " evaluations")
+        if self.seconds is not None and time.perf_counter() - self.start > self.seconds:
+            raise BudgetExceeded("Used up the budget of " + str(self.seconds) + " seconds")
+
+    def wrap(self, function):
+        """Function that calls ``check`` before each call of ``function``.
+
+        Parameters
+        ----------
+        function : callable
+            Function to wrap
+
+        Returns
+        -------
+        callable
+        """
+        def checked(*args, **kwargs):
+            self.check()
+            return function(*args, **kwargs)
+        return checked
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a ``SolverBudget`` is used up."""
+
+
+def solve_two_stage(estimator, init=None, full_output=False, compress=False):
+    """Two-stage solver for the parameters of the estimator classes in ``efuncs``. Each logistic nuisance model is fit
+    on its own by iteratively reweighted least squares (or taken from the estimator's ``NuisanceCache``), then the
+    weighted means and the contrasts (average treatment effect, diagnostic) are computed directly. This gives the root
+    of the stacked estimating functions without a joint search over all parameters.
+
+    Parameters
+    ----------
+    estimator : BridgeSingleSpan, BridgeMultiSpan, NaiveSingleSpan, NaiveMultiSpan
+        Estimator with the data bound
+    init : ndarray, list, None, optional
+        Initial values, whose nuisance parameters are used as the starting values of the logistic models. Default is
+        None, where the logistic models start at zero.
+    full_output : bool, optional
+        Whether to also return the number of IRLS iterations over all the logistic models. Default is False.
+    compress : bool, optional
+        Whether the logistic models are fit over the unique patterns of their rows, see ``irls_logistic``. Default is
+        False.
+
+    Returns
+    -------
+    ndarray, or ndarray and int with ``full_output``
+    """
+    beta, gammas, iterations = None, [], 0
+    if estimator.sampling is not None:
+        if init is None:                                            # Logistic models start at zero
+            beta_init, gamma_inits = None, [None, ] * len(estimator.models)
+        else:                                                       # ... or at the nuisance parameters of init
+            _, _, beta_init, gamma_inits = estimator._unpack_(np.asarray(init, dtype=float))
+        coefs = []
+        for j, ((_, X, outcome), start) in enumerate(zip([estimator.sampling] + estimator.models,
+                                                         [beta_init] + gamma_inits)):
+            if estimator.cache is None:                             # Design and outcome on the model rows
+                coef, steps = irls_logistic(X=X, y=outcome, init=start, full_output=True, compress=compress)
+            else:                                                   # ... fit once across estimators sharing the cache
+                coef, steps = estimator.cache.fit(X=X, y=outcome, key=estimator.keys[j], init=start, full_output=True,
+                                                  compress=compress)
+            coefs.append(coef)
+            iterations += steps
+        beta, gammas = coefs[0], coefs[1:]
+
+    # Weighted means and contrasts
+    mu = estimator._means_(estimator._weights_(beta=beta, gammas=gammas))
+    theta = np.concatenate([np.dot(estimator.contrasts, mu), mu] + ([] if beta is None else [beta] + gammas))
+    if full_output:
+        return theta, iterations
+    return theta
+
+
+def solve_bridge_ss(init, y, a, r, m, W, V3, V1):
+    """Two-stage solver for the parameters of ``ee_bridge_ss``, see ``solve_two_stage``."""
+    return solve_two_stage(BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V1=V1), init=init)
+
+
+def solve_bridge_ms(init, y, a, r, m, W, V3, V2a, V2b, V1):
+    """Two-stage solver for the parameters of ``ee_bridge_ms``, see ``solve_two_stage``."""
+    return solve_two_stage(BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V3, V2a=V2a, V2b=V2b, V1=V1), init=init)
+
+
+def irls_logistic(X, y, subset=1, init=None, tolerance=1e-12, maxiter=100, full_output=False, compress=False):
+    """Solve the logistic regression score equations, restricted to a subset, by Newton-Raphson (iteratively
+    reweighted least squares). If the iterations started from ``init`` do not converge, they are restarted from zero.
+
+    Parameters
+    ----------
+    X : ndarray
+        Design matrix
+    y : ndarray
+        Binary outcome
+    subset : ndarray, int, optional
+        Indicator for the observations that contribute to the model. Default is 1, which uses all observations.
+    init : ndarray, None, optional
+        Starting values. Default is None, which starts at zero.
+    tolerance : float, optional
+        Convergence tolerance for the largest change in a coefficient. Default is 1e-12.
+    maxiter : int, optional
+        Maximum number of iterations. Default is 100.
+    full_output : bool, optional
+        Whether to also return the number of iterations (including any restart). Default is False.
+    compress : bool, optional
+        Whether to iterate over the unique (design row, outcome) patterns with the number of rows as frequency
+        weights, which gives the same solution. Default is False.
+
+    Returns
+    -------
+    ndarray, or ndarray and int with ``full_output``
+    """
+    X = np.asarray(X, dtype=float)
+    weight = np.broadcast_to(np.asarray(subset, dtype=float), (X.shape[0], ))
+    y = np.asarray(y, dtype=float)
+    patterns = _patterns_(X[None], y[None], weight[None]) if compress else None
+    if patterns is not None:
+        X, y, weight = patterns[0][0], patterns[1][0], patterns[2][0]
+    starts = [np.zeros(X.shape[1])] if init is None else [np.asarray(init, dtype=float), np.zeros(X.shape[1])]
+    iterations = 0
+    for beta in starts:
+        for i in range(maxiter):
+            iterations += 1
+            step = _irls_step_(X=X, y=y, weight=weight, beta=beta)
+            if step is None:
+                break
+            beta = beta + step
+            if np.max(np.abs(step)) < tolerance:
+                return (beta, iterations) if full_output else beta
+    raise RuntimeError("Logistic model failed to converge")
+
+
+def _irls_step_(X, y, weight, beta):
+    """Internal function for a Newton-Raphson step of the logistic model from ``beta``, or None if the step fails."""
+    pred = inverse_logit(np.dot(X, beta))
+    score = np.dot(X.T, weight * (y - pred))
+    info = np.dot((X * (weight * pred * (1 - pred))[:, None]).T, X)
+    try:
+        step = np.linalg.solve(info, score)
+    except np.linalg.LinAlgError:
+        return None
+    if not np.all(np.isfinite(step)):
+        return None
+    return step
+
+
+def _batched_solve_(a, b):
+    """Internal function to solve a stack of linear systems. Systems that are singular or give a non-finite solution
+    are flagged (with a zero step) rather than stopping the others.
+    """
+    try:
+        step = np.linalg.solve(a, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:                                       # Solving one at a time to find the singular
+        step = np.zeros(b.shape)
+        for i in range(b.shape[0]):
+            try:
+                step[i] = np.linalg.solve(a[i], b[i])
+            except np.linalg.LinAlgError:
+                step[i] = np.nan
+    failed = ~np.all(np.isfinite(step), axis=1)
+    step[failed] = 0.
+    return step, failed
+
+
+def _patterns_(X, outcome, weight, limit=0.5):
+    """Internal function to compress the rows of a stack of logistic models, with shape (replicates, rows, columns),
+    into the unique (design row, outcome) patterns of each replicate, with the summed weight of the rows as frequency
+    weights. Rows with zero weight are dropped, and replicates are padded with zero-weight patterns to the same number.
+    Returns None if a replicate has more than ``limit`` times as many patterns as rows, where it does not pay off.
+    """
+    n_reps, n, k = X.shape
+    flat_X, flat_y, flat_w = X.reshape(-1, k), outcome.reshape(-1), weight.reshape(-1)
+    rows = np.flatnonzero(flat_w)
+    if rows.shape[0] == 0:
+        return None
+    for column in [X[0, :, c] for c in range(k)] + [outcome[0]]:   # Quick check of the first replicate
+        if np.unique(column).shape[0] > limit * n:
+            return None
+
+    # Pattern of each row, from the codes of the replicate and each column (in that order, so the patterns are sorted
+    #   by replicate)
+    key = rows // n
+    for column in [flat_X[rows, c] for c in range(k)] + [flat_y[rows]]:
+        values, codes = np.unique(column, return_inverse=True)
+        if values.shape[0] > 1:
+            _, key = np.unique(key * values.shape[0] + codes.reshape(-1), return_inverse=True)
+            key = key.reshape(-1)
+            if key.max() + 1 > limit * n * n_reps:                      # Too many patterns already
+                return None
+    n_patterns = key.max() + 1
+    first = np.empty(n_patterns, dtype=np.int64)                        # A row of each pattern
+    first[key] = rows
+    replicate = first // n
+    size = np.bincount(replicate, minlength=n_reps)
+    if size.max() > limit * n:
+        return None
+
+    # Patterns of each replicate, padded with zero weight
+    position = np.arange(n_patterns) - np.searchsorted(replicate, replicate)
+    X_p, y_p, w_p = np.zeros((n_reps, size.max(), k)), np.zeros((n_reps, size.max())), np.zeros((n_reps, size.max()))
+    X_p[replicate, position] = flat_X[first]
+    y_p[replicate, position] = flat_y[first]
+    w_p[replicate, position] = np.bincount(key, weights=flat_w[rows], minlength=n_patterns)
+    return X_p, y_p, w_p
+
+
+def _weighted_gram_(X, weight):
+    """Internal function for X^T diag(weight) X of each replicate in a stack of design matrices."""
+    return np.matmul(np.swapaxes(X, 1, 2) * weight[:, None, :], X)
+
+
+def _take_(data, index):
+    """Internal function to select a set of replicates from the stacked data. Arrays shared between keys (e.g., one
+    design matrix for several models) stay shared.
+    """
+    taken = {}
+    for key, value in data.items():
+        if id(value) not in taken:
+            taken[id(value)] = value[index]
+    return {key: taken[id(value)] for key, value in data.items()}
@@ -7,6 +7,7 @@
 
 # Importing dependencies
 import numpy as np
+import pandas as pd
 
 
 def calculate_metrics(scenario, estimator, bias, se, coverage, bias_diagnostic=None, coverage_diagnostic=None):
@@ -47,3 +48,213 @@ def calculate_metrics(scenario, estimator, bias, se, coverage, bias_diagnostic=N
         bd = np.nanmean(bias_diagnostic)         # Compute difference from zero for diagnostic
         cd = np.nanmean(coverage_diagnostic)     # Compute coverage of zero for diagnostics
         return scenario, estimator, b, ase, ese, ser, rmse, c, bd, cd
+
+
+class MetricAccumulator:
+    """Streaming version of ``calculate_metrics``. Replicate results are added in blocks with ``update``, and the
+    accumulators of other workers or shards are combined with ``merge``. Only the count, mean, and sum of squared
+    deviations of each quantity are kept (Welford's online algorithm, with the pairwise update of Chan et al. for
+    blocks), so the number of replicates is not limited by memory. NaN values (e.g., from failed fits) are skipped
+    separately for each quantity, as with ``np.nanmean`` and ``np.nanstd``.
+
+    Parameters
+    ----------
+    scenario : int, str
+        Label for the scenario
+    estimator : str
+        Label for the input estimator
+    diagnostic : bool, optional
+        Whether the diagnostic is also calculated. Default is False.
+    """
+    quantities = ("bias", "se", "coverage", "bias_diagnostic", "coverage_diagnostic")
+
+    def __init__(self, scenario, estimator, diagnostic=False):
+        self.scenario = scenario
+        self.estimator = estimator
+        self.diagnostic = diagnostic
+        self.count = dict.fromkeys(self.quantities, 0)
+        self.mean = dict.fromkeys(self.quantities, 0.)
+        self.m2 = dict.fromkeys(self.quantities, 0.)
+
+    def update(self, bias, se, coverage, bias_diagnostic=None, coverage_diagnostic=None):
+        """Add a block of replicates, with the same inputs as ``calculate_metrics``.
+
+        Parameters
+        ----------
+        bias : ndarray
+            Array of bias estimates
+        se : ndarray
+            Array of standard error estimates
+        coverage : ndarray
+            Array of whether confidence interval covers the truth
+        bias_diagnostic : ndarray, None
+            Optional array of bias estimates for the diagnostic
+        coverage_diagnostic : ndarray, None
+            Optional array of whether confidence interval covers zero for the diagnostic
+
+        Returns
+        -------
+        MetricAccumulator
+        """
+        values = {"bias": bias, "se": se, "coverage": coverage,
+                  "bias_diagnostic": bias_diagnostic, "coverage_diagnostic": coverage_diagnostic}
+        for name, x in values.items():
+            if x is None:
+                continue
+            x = np.asarray(x, dtype=float).ravel()
+            x = x[~np.isnan(x)]                                 # Skip NaN, as np.nanmean
+            if x.shape[0] > 0:
+                mean = np.mean(x)
+                self._combine_(name, count=x.shape[0], mean=mean, m2=np.sum((x - mean)**2))
+        return self
+
+    def merge(self, other):
+        """Add the replicates of another accumulator, e.g., from another worker or shard.
+
+        Parameters
+        ----------
+        other : MetricAccumulator
+            Accumulator for the same scenario and estimator
+
+        Returns
+        -------
+        MetricAccumulator
+        """
+        for name in self.quantities:
+            self._combine_(name, count=other.count[name], mean=other.mean[name], m2=other.m2[name])
+        return self
+
+    def metrics(self):
+        """Performance metrics of the replicates added so far.
+
+        Returns
+        -------
+        list :
+            Same output as ``calculate_metrics``
+        """
+        mean = {name: self.mean[name] if self.count[name] > 0 else np.nan for name in self.quantities}
+        b = mean["bias"]                                        # Compute bias
+        ase = mean["se"]                                        # Compute average standard error
+        if self.count["bias"] > 1:                              # Compute empirical standard error
+            ese = np.sqrt(self.m2["bias"] / (self.count["bias"] - 1))
+        else:
+            ese = np.nan
+        ser = ase / ese                                         # Compute standard error ratio
+        c = mean["coverage"]                                    # Compute confidence interval coverage
+        rmse = np.sqrt(b**2 + ese**2)                           # Compute root mean squared error
+
+        # Return metrics based on whether diagnostic is also calculated
+        if not self.diagnostic:
+            return self.scenario, self.estimator, b, ase, ese, ser, rmse, c, np.nan, np.nan
+        bd = mean["bias_diagnostic"]                            # Compute difference from zero for diagnostic
+        cd = mean["coverage_diagnostic"]                        # Compute coverage of zero for diagnostics
+        return self.scenario, self.estimator, b, ase, ese, ser, rmse, c, bd, cd
+
+    def mcse(self):
+        """Monte Carlo standard errors of the bias, empirical standard error, and coverage of the replicates added so
+        far, following Morris, White, & Crowther (2019).
+
+        Returns
+        -------
+        list :
+            Number of replicates, and the Monte Carlo standard error of the bias, ESE, and coverage
+        """
+        n = self.count["bias"]
+        ese = np.sqrt(self.m2["bias"] / (n - 1)) if n > 1 else np.nan
+        bias_mcse = ese / np.sqrt(n) if n > 1 else np.nan                   # MCSE of bias
+        ese_mcse = ese / np.sqrt(2*(n - 1)) if n > 1 else np.nan            # MCSE of ESE
+        c, n_c = self.mean["coverage"], self.count["coverage"]
+        c_mcse = np.sqrt(c*(1 - c) / n_c) if n_c > 0 else np.nan            # MCSE of coverage
+        return n, bias_mcse, ese_mcse, c_mcse
+
+    def meets(self, targets):
+        """Whether the Monte Carlo standard errors are at or below the targets.
+
+        Parameters
+        ----------
+        targets : dict
+            Largest acceptable Monte Carlo standard error for any of ``bias``, ``ese``, and ``coverage``
+
+        Returns
+        -------
+        bool
+        """
+        n, bias_mcse, ese_mcse, c_mcse = self.mcse()
+        achieved = {"bias": bias_mcse, "ese": ese_mcse, "coverage": c_mcse}
+        return all(achieved[name] <= target for name, target in targets.items())
+
+    def _combine_(self, name, count, mean, m2):
+        """Internal function to combine the count, mean, and sum of squared deviations of a quantity with those of
+        another set of replicates (Chan et al.'s pairwise update).
+        """
+        if count == 0:
+            return
+        total = self.count[name] + count
+        delta = mean - self.mean[name]
+        self.mean[name] += delta * count / total
+        self.m2[name] += m2 + delta**2 * self.count[name] * count / total
+        self.count[name] = total
+
+
+def aggregate_metrics(replicates, by=("scenario", "estimator"), mcse=False):
+    """Calculate the performance metrics for the simulation experiment from the replicate-level results, for every
+    group of replicates at once. Any slice of the stored results (see ``ReplicateStore.table``) can be summarized
+    again this way without rerunning the simulation.
+
+    Parameters
+    ----------
+    replicates : DataFrame
+        Replicate-level results, with the columns truth, estimate, variance, lower, upper, diag_estimate, diag_lower,
+        and diag_upper (NaN for estimators without the diagnostic)
+    by : list, tuple
+        Columns that define the groups. Default is scenario and estimator.
+    mcse : bool, optional
+        Whether to add the number of replicates and the Monte Carlo standard errors of the bias, ESE, and coverage (see
+        ``MetricAccumulator.mcse``). Default is False.
+
+    Returns
+    -------
+    DataFrame :
+        Bias, ASE, ESE, SER, RMSE, C, Diag, and DiagC for each group, followed by N, MCSE_Bias, MCSE_ESE, and MCSE_C
+    """
+    d = pd.DataFrame({"Bias": replicates["estimate"] - replicates["truth"],             # Bias
+                      "ASE": np.sqrt(replicates["variance"]),                           # Standard error
+                      "C": covers(replicates["lower"], replicates["upper"], replicates["truth"]),
+                      "Diag": replicates["diag_estimate"] - 0,                          # Diagnostic difference from 0
+                      "DiagC": covers(replicates["diag_lower"], replicates["diag_upper"], 0)})
+    groups = d.groupby([replicates[column] for column in by], observed=True, sort=False)
+    table = groups.mean()                                       # Bias, ASE, coverage, and diagnostics are averages
+    table["ESE"] = groups["Bias"].std(ddof=1)                   # Compute empirical standard error
+    table["SER"] = table["ASE"] / table["ESE"]                  # Compute standard error ratio
+    table["RMSE"] = np.sqrt(table["Bias"]**2 + table["ESE"]**2)  # Compute root mean squared error
+    columns = ["Bias", "ASE", "ESE", "SER", "RMSE", "C", "Diag", "DiagC"]
+    if mcse:                                                    # Monte Carlo standard errors
+        n = groups["Bias"].count()
+        table["N"] = n
+        table["MCSE_Bias"] = table["ESE"] / np.sqrt(n)
+        table["MCSE_ESE"] = table["ESE"] / np.sqrt(2*(n - 1))
+        table["MCSE_C"] = np.sqrt(table["C"]*(1 - table["C"]) / groups["C"].count())
+        columns += ["N", "MCSE_Bias", "MCSE_ESE", "MCSE_C"]
+    return table[columns]
+
+
+def covers(lower, upper, value):
+    """Whether each confidence interval covers the value (strictly inside the bounds), as the coverage input of
+    ``calculate_metrics``.
+
+    Parameters
+    ----------
+    lower : ndarray
+        Lower bounds of the confidence intervals
+    upper : ndarray
+        Upper bounds of the confidence intervals
+    value : float, ndarray
+        Value to be covered, e.g., the truth
+
+    Returns
+    -------
+    ndarray :
+        1 if covered and 0 if not, NaN where the interval is missing (e.g., from a failed fit)
+    """
+    lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+    return np.where(np.isnan(lower) | np.isnan(upper), np.nan, (lower < value) & (value < upper))
@@ -0,0 +1,683 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Functions to run the simulation replicates for a scenario, either serially or over a process pool
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import time
+import warnings
+from functools import partial
+import numpy as np
+
+from dgm import generate_arrays, generate_batch, draw_common, apply_scenario
+from efuncs import NaiveSingleSpan, NaiveMultiSpan, BridgeSingleSpan, BridgeMultiSpan
+from mestimation import (AnalyticMEstimator, BatchedMEstimator, NaiveDirectEstimator, NuisanceCache, SolverBudget,
+                         BudgetExceeded, WarmStart, solve_two_stage)
+from metrics import MetricAccumulator, aggregate_metrics, covers
+
+# Order that the estimators are reported in the results tables
+estimators = ('Naive MS', 'Naive SS', 'Bridge MS', 'Bridge SS')
+
+# Results kept for each estimator in each replicate: the estimate, variance, and confidence interval of the ATE and of
+#   the diagnostic (NaN for the Single-Span estimators), whether the root-finding converged, the fitting time, the
+#   number of attempts of the fallback chain, the reason for a failure (coded by position in ``failures``: the first
+#   failed attempt when a later one succeeded, otherwise the last), and
+#   the number of iterations of the root-finding (including the steps for the starting values, and with the steps of
+#   the nuisance models shared with an earlier fit, so each outcome reports the steps of its own solution)
+fields = ('estimate', 'variance', 'lower', 'upper', 'diag_estimate', 'diag_variance', 'diag_lower', 'diag_upper',
+          'converged', 'seconds', 'attempts', 'failure', 'iterations')
+failures = ('none', 'nonconvergence', 'singular', 'nonfinite', 'budget')
+
+
+def replicate_seed(seed, n1, n0, scenario, replicate, common=False):
+    """Random number stream for a single simulation replicate. The stream is a child of the overall seed that is
+    indexed by the cell of the simulation grid and the replicate number, so the generated data for a replicate does not
+    depend on the order in which replicates are run or on how many workers run them. With ``common``, the stream is
+    only indexed by the replicate number, so the replicate shares its random numbers with every cell of the grid.
+
+    Parameters
+    ----------
+    seed : int
+        Overall seed for the simulation experiment
+    n1 : int
+        Number of observations in the trial in the target population
+    n0 : int
+        Number of observations in the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism
+    replicate : int
+        Index of the replicate
+    common : bool, optional
+        Whether the stream is shared by all cells of the simulation grid (common random numbers). Default is False.
+
+    Returns
+    -------
+    SeedSequence
+    """
+    if common:
+        return np.random.SeedSequence(seed, spawn_key=(replicate, ))
+    return np.random.SeedSequence(seed, spawn_key=(n1, n0, scenario, replicate))
+
+
+def initial_values(continuous):
+    """Starting values for the root-finding of the Single-Span and Multi-Span estimators, in the general vicinity of
+    the parameters for the corresponding outcome type.
+
+    Parameters
+    ----------
+    continuous : bool
+        Whether the continuous (True) or binary (False) outcome is being estimated
+
+    Returns
+    -------
+    list, list
+    """
+    if continuous:
+        ss_init = [60., 300., 240.]
+        ms_init = [60., 0., 300., 270., 270., 240.]
+    else:
+        ss_init = [0.5, 0.9, 0.4]
+        ms_init = [0.5, 0.0, 0.9, 0.65, 0.65, 0.4]
+    return ss_init, ms_init
+
+
+def fit_replicate(data, continuous, cache=None, budget=None, initializer=None):
+    """Apply the four estimators to a single simulated data set. The bridge estimators try the attempts of
+    ``fallback_chain`` in order until one succeeds, all within ``budget``, and the reason for any failure is kept.
+
+    Parameters
+    ----------
+    data : dict
+        Data set from ``generate_arrays``
+    continuous : bool
+        Whether the continuous (True) or binary (False) outcome is being estimated
+    cache : NuisanceCache, None, optional
+        Cache of fitted nuisance models for this data set, e.g., to share with the other outcome type. Default is None,
+        which uses a new cache shared by the two bridge estimators.
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate, as the
+        arguments of ``SolverBudget`` (``seconds``, ``evaluations``). Default is None, which has no budget.
+    initializer : WarmStart, None, optional
+        Initializer for the starting values of the bridge estimators, which is updated with their solutions. Default
+        is None, which uses the fixed values of ``initial_values``.
+
+    Returns
+    -------
+    dict :
+        Values of ``fields`` keyed by the estimator label. Values that an estimator does not produce (or that failed in
+        root-finding) are NaN
+    """
+    ss_init, ms_init = initial_values(continuous=continuous)
+    r, a, m = data['r'], data['a'], data['m']                   # Sampling, treatment arm, and missing indicators
+    W, V = data['W'], data['V']                                 # Sampling and missing model design matrices
+    if continuous:                                              # Outcome depends on outcome type
+        y = data['y']
+    else:
+        y = data['b']
+
+    # Estimators with the data for this replicate bound once (no module globals, so picklable). Missing models with
+    #   the same rows (A=3, and A=1) are only fit once for both bridge estimators
+    if cache is None:
+        cache = NuisanceCache()
+    bridge_ss = BridgeSingleSpan(y=y, a=a, r=r, m=m, W=W, V3=V, V1=V, cache=cache)
+    bridge_ms = BridgeMultiSpan(y=y, a=a, r=r, m=m, W=W, V3=V, V2a=V, V2b=V, V1=V, cache=cache)
+    bridge_inits = [0., 1., 0., ] + [1.5, -0.5, ]*2
+
+    # Naive estimators are solved directly, and bridge estimators use the two-stage solver and the analytic
+    #   derivatives for the bread
+    results = {}
+    results['Naive SS'] = _fit_(NaiveDirectEstimator(NaiveSingleSpan, y=y, m=m, a=a, r=r), diagnostic=False)
+    results['Naive MS'] = _fit_(NaiveDirectEstimator(NaiveMultiSpan, y=y, m=m, a=a, r=r), diagnostic=True)
+    bridges = {'Bridge SS': bridge_ss, 'Bridge MS': bridge_ms}
+    inits = {'Bridge SS': ss_init + bridge_inits, 'Bridge MS': ms_init + bridge_inits + [1.5, -0.5, ]*2}
+    for label, bridge in bridges.items():
+        if initializer is not None:                             # Starting values from the initializer instead, after
+            inits[label] = list(initializer(bridge, label=label))   # ... any earlier fit of the shared models
+        estr = AnalyticMEstimator(bridge.psi, jacobian=bridge.jacobian, init=inits[label])
+        attempts = fallback_chain(partial(solve_two_stage, bridge, full_output=True), init=inits[label],
+                                  n_nuisance=bridge.n_params - bridge.blocks[2].start)
+        results[label] = _fit_(estr, diagnostic=label.endswith('MS'), attempts=attempts, budget=budget)
+        if initializer is not None and results[label][fields.index('converged')]:
+            initializer.update(label, estr.theta)
+    return results
+
+
+def fallback_chain(solver, init, n_nuisance, maxiter=2000):
+    """Attempts for fitting a bridge estimator, tried in order until one succeeds: the two-stage solver, then joint
+    searches over all parameters with Levenberg-Marquardt from the default starting values and from the nuisance
+    parameters at zero, then Powell's hybrid method from the default starting values.
+
+    Parameters
+    ----------
+    solver : callable
+        Two-stage solver with the estimator bound, see ``solve_two_stage``
+    init : list
+        Default starting values of all the parameters, with the nuisance parameters last
+    n_nuisance : int
+        Number of nuisance parameters
+    maxiter : int, optional
+        Maximum number of function evaluations for each joint search. Default is 2000.
+
+    Returns
+    -------
+    list :
+        Options for ``AnalyticMEstimator.estimate`` of each attempt, with the starting values under ``init``
+    """
+    init = list(init)
+    zero = init[:len(init) - n_nuisance] + [0., ]*n_nuisance
+    return [{'solver': solver, 'init': init},
+            {'solver': 'lm', 'init': init, 'maxiter': maxiter},
+            {'solver': 'lm', 'init': zero, 'maxiter': maxiter},
+            {'solver': 'hybr', 'init': init, 'maxiter': maxiter}]
+
+
+def fit_outcomes(data, outcomes, budget=None, initializer=None):
+    """Apply the four estimators to a single simulated data set for each outcome type. The nuisance models are fit once
+    and shared by the outcome types (and the bridge estimators) through a ``NuisanceCache``.
+
+    Parameters
+    ----------
+    data : dict
+        Data set from ``generate_arrays``
+    outcomes : list
+        Outcome types to estimate (True for continuous, False for binary)
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate, as the
+        arguments of ``SolverBudget`` (``seconds``, ``evaluations``). Default is None, which has no budget.
+    initializer : WarmStart, None, optional
+        Initializer for the starting values of the bridge estimators, which is updated with their solutions. Default
+        is None, which uses the fixed values of ``initial_values``.
+
+    Returns
+    -------
+    dict :
+        Output of ``fit_replicate`` keyed by outcome type
+    """
+    cache = NuisanceCache()
+    return {continuous: fit_replicate(data=data, continuous=continuous, cache=cache, budget=budget,
+                                      initializer=initializer)
+            for continuous in outcomes}
+
+
+def fit_batch(batch, outcomes, cache=None, budget=None, initializer=None, compress=False):
+    """Apply the four estimators to a stack of simulated data sets at once for each outcome type, with
+    ``NaiveDirectEstimator`` and ``BatchedMEstimator``. The bridge estimators are solved for all the outcome types
+    together, so the nuisance models and weights are computed once. Any replicate where the batched root-finding does
+    not converge for an estimator is refit on its own with ``fit_outcomes``. The fitting time of each replicate is its
+    share of the time for the batch.
+
+    Parameters
+    ----------
+    batch : dict
+        Data sets from ``generate_batch``
+    outcomes : list
+        Outcome types to estimate (True for continuous, False for binary)
+    cache : NuisanceCache, None, optional
+        Cache of fitted nuisance models for these data sets. Default is None, which uses a new cache shared by the two
+        bridge estimators.
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate that is
+        refit, as the arguments of ``SolverBudget`` (``seconds``, ``evaluations``). Default is None, which has no
+        budget.
+    initializer : WarmStart, None, optional
+        Initializer for the starting values of the replicates that are refit, which is first updated with the average
+        solution of the converged replicates. Default is None, which uses the fixed values of ``initial_values``.
+    compress : bool, optional
+        Whether the batched Newton-Raphson steps of the logistic models run over the unique patterns of their rows (see
+        ``BatchedMEstimator``). Default is False.
+
+    Returns
+    -------
+    dict :
+        Output of ``fit_replicate`` for each replicate, keyed by outcome type
+    """
+    outcomes = list(outcomes)
+    r, a, m = batch['r'], batch['a'], batch['m']                # Sampling, treatment arm, and missing indicators
+    W, V = batch['W'], batch['V']                               # Sampling and missing model design matrices
+    y = np.stack([batch['y'] if continuous else batch['b'] for continuous in outcomes])
+    ss_init, ms_init = initial_values(continuous=outcomes[0])   # Only the nuisance model values are used
+    bridge_inits = [0., 1., 0., ] + [1.5, -0.5, ]*2
+    n_reps = m.shape[0]
+
+    if cache is None:
+        cache = NuisanceCache()
+    bridge = {'Bridge SS': BatchedMEstimator(BridgeSingleSpan, init=ss_init + bridge_inits, y=y, m=m, a=a, r=r,
+                                             W=W, V3=V, V1=V, cache=cache, compress=compress),
+              'Bridge MS': BatchedMEstimator(BridgeMultiSpan, init=ms_init + bridge_inits + [1.5, -0.5, ]*2,
+                                             y=y, m=m, a=a, r=r, W=W, V3=V, V2a=V, V2b=V, V1=V, cache=cache,
+                                             compress=compress)}
+    seconds = {}
+    for label, estr in bridge.items():
+        start = time.perf_counter()
+        estr.estimate()
+        seconds[label] = (time.perf_counter() - start) / (n_reps * len(outcomes))
+        theta = estr.theta if estr.n_outcomes is None else estr.theta[0]
+        if initializer is not None and np.any(estr.converged):     # Refits start near the batch solution
+            initializer.update(label, np.mean(theta[estr.converged], axis=0))
+    converged = {label: estr.converged for label, estr in bridge.items()}
+    iterations = {label: estr.iterations for label, estr in bridge.items()}
+
+    results = {}
+    for k, continuous in enumerate(outcomes):
+        naive = {'Naive SS': NaiveDirectEstimator(NaiveSingleSpan, y=y[k], m=m, a=a, r=r),
+                 'Naive MS': NaiveDirectEstimator(NaiveMultiSpan, y=y[k], m=m, a=a, r=r)}
+        estimates = {}
+        for label, estr in naive.items():
+            start = time.perf_counter()
+            estr.estimate()
+            seconds[label] = (time.perf_counter() - start) / n_reps
+            estimates[label] = estr.theta, estr.variance, estr.confidence_intervals(), estr.converged
+            iterations[label] = np.zeros(n_reps, dtype=int)
+        for label, estr in bridge.items():
+            estimates[label] = estr.theta[k], estr.variance[k], estr.confidence_intervals()[k], estr.converged
+        converged.update({label: estr.converged for label, estr in naive.items()})
+        results[continuous] = [{label: _summary_(theta=theta[i], variance=variance[i], ci=ci[i], converged=flags[i],
+                                                 diagnostic=label.endswith('MS'), seconds=seconds[label],
+                                                 iterations=iterations[label][i])
+                                for label, (theta, variance, ci, flags) in estimates.items()}
+                               for i in range(n_reps)]
+
+    # Refitting any replicates that failed to converge in the batch
+    for i in np.flatnonzero(~np.all(list(converged.values()), axis=0)):
+        refit = fit_outcomes(data={key: value[i] for key, value in batch.items()}, outcomes=outcomes, budget=budget,
+                             initializer=initializer)
+        for label, flags in converged.items():
+            if not flags[i]:
+                for continuous in outcomes:
+                    results[continuous][i][label] = refit[continuous][label]
+    return results
+
+
+def run_replicate(seed, n1, n0, scenario, outcomes, common_sizes=None, budget=None, warm_start=False):
+    """Generate and analyze a single simulation replicate using its own random number stream. Defined at the module
+    level so it can be sent to worker processes.
+
+    Parameters
+    ----------
+    seed : SeedSequence
+        Random number stream for the replicate, see ``replicate_seed``
+    n1 : int
+        Number of observations in the trial in the target population
+    n0 : int
+        Number of observations in the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    outcomes : list
+        Outcome types to estimate (True for continuous, False for binary)
+    common_sizes : tuple, None, optional
+        Largest trial sizes (n1, n0) of the simulation grid. When given, the data is made with ``apply_scenario`` from
+        common random numbers of these sizes (see ``draw_common``), so every scenario and smaller trial size reuses the
+        same draws. Default is None, which draws the data for the scenario and trial sizes directly.
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate, as the
+        arguments of ``SolverBudget`` (``seconds``, ``evaluations``). Default is None, which has no budget.
+    warm_start : bool, optional
+        Whether the bridge estimators start from a ``WarmStart`` instead of fixed values. Default is False.
+
+    Returns
+    -------
+    dict
+    """
+    rng = np.random.default_rng(seed)                           # Random number generator for this replicate
+    if common_sizes is None:
+        data = generate_arrays(n1=n1, n0=n0, scenario=scenario, rng=rng)
+    else:
+        common = draw_common(sims=1, n1=common_sizes[0], n0=common_sizes[1], rng=rng)
+        batch = apply_scenario(common=common, n1=n1, n0=n0, scenario=scenario)
+        data = {key: value[0] for key, value in batch.items()}
+    initializer = WarmStart(reuse=False) if warm_start else None   # Nothing to reuse within a single replicate
+    return fit_outcomes(data=data, outcomes=outcomes, budget=budget, initializer=initializer)
+
+
+def run_block(seed, size, n1, n0, scenario, outcomes, common_sizes=None, budget=None, warm_start=False,
+              compress=False):
+    """Generate a block of simulation replicates with a single vectorized draw, and analyze them together with
+    ``fit_batch``. Defined at the module level so it can be sent to worker processes.
+
+    Parameters
+    ----------
+    seed : SeedSequence
+        Random number stream for the block
+    size : int
+        Number of replicates in the block
+    n1 : int
+        Number of observations in the trial in the target population
+    n0 : int
+        Number of observations in the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    outcomes : list
+        Outcome types to estimate (True for continuous, False for binary)
+    common_sizes : tuple, None, optional
+        Largest trial sizes (n1, n0) of the simulation grid. When given, the data is made with ``apply_scenario`` from
+        common random numbers of these sizes (see ``draw_common``), so every scenario and smaller trial size reuses the
+        same draws. Default is None, which draws the data for the scenario and trial sizes directly.
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate, as the
+        arguments of ``SolverBudget`` (``seconds``, ``evaluations``). Default is None, which has no budget.
+    warm_start : bool, optional
+        Whether the bridge estimators start from a ``WarmStart`` instead of fixed values. Default is False.
+    compress : bool, optional
+        Whether the logistic models are fit over the unique patterns of their rows, see ``fit_batch``. Default is
+        False.
+
+    Returns
+    -------
+    dict
+    """
+    rng = np.random.default_rng(seed)                           # Random number generator for this block
+    if common_sizes is None:
+        batch = generate_batch(sims=size, n1=n1, n0=n0, scenario=scenario, rng=rng)
+    else:
+        common = draw_common(sims=size, n1=common_sizes[0], n0=common_sizes[1], rng=rng)
+        batch = apply_scenario(common=common, n1=n1, n0=n0, scenario=scenario)
+    initializer = WarmStart() if warm_start else None
+    return fit_batch(batch=batch, outcomes=outcomes, budget=budget, initializer=initializer, compress=compress)
+
+
+def run_scenario(n1, n0, scenario, truths, sims, seed, pool=None, chunksize=8, batch_size=None, store=None,
+                 precision=None, step=100, common_sizes=None, budget=None, warm_start=False, compress=False):
+    """Run all replicates for a scenario and summarize them into the performance metrics for each estimator. Each
+    generated replicate is analyzed for every outcome type in ``truths``, so the data is only generated once. With a
+    ``store``, the replicate results are appended to it as they finish, replicates already in it are skipped, and the
+    metrics are computed from the stored results, so a stopped run can be restarted where it left off. Without one, the
+    replicate results are added to a ``MetricAccumulator`` as they finish and are not kept.
+
+    With ``precision``, replicates are run sequentially in rounds of ``step`` and an outcome type stops once the Monte
+    Carlo standard errors of every estimator meet its targets (or after ``sims`` replicates). Replicates are always
+    used in order, so the stopping point only depends on the settings.
+
+    With ``common_sizes``, the random number streams are indexed by the replicate (or block) only, so replicate ``i``
+    of every scenario and trial size is made from the same draws (common random numbers), with the smaller trials
+    nested in the larger ones. Comparisons between cells are then paired, which reduces their Monte Carlo error.
+
+    Replicates where an estimator failed (after its fallback chain) are kept with the reason for the failure, and a
+    warning reports how many failed for each estimator and reason.
+
+    Parameters
+    ----------
+    n1 : int
+        Number of observations in the trial in the target population
+    n0 : int
+        Number of observations in the trial in the secondary population
+    scenario : int
+        Scenario for the data generating mechanism, 1-5 are valid options.
+    truths : dict
+        True value of the average treatment effect keyed by outcome type (True for continuous, False for binary)
+    sims : int
+        Number of replicates, or the largest number of replicates with ``precision``
+    seed : int
+        Overall seed for the simulation experiment
+    pool : Executor, None, optional
+        ``concurrent.futures`` executor to distribute the replicates over. Default is None, which runs the replicates
+        serially in the current process. The results do not depend on the number of workers.
+    chunksize : int, optional
+        Number of replicates sent to a worker at a time. Default is 8.
+    batch_size : int, None, optional
+        Number of replicates to generate with ``generate_batch`` and fit with ``fit_batch`` together. Each block then
+        has its own random number stream (instead of each replicate), so results depend on ``batch_size`` but still not
+        on the number of workers. Default is None, which generates and fits each replicate separately.
+    store : ReplicateStore, None, optional
+        Store for the replicate results. Results are appended at least every ``chunksize`` replicates (or every block).
+        Default is None, which keeps the results in memory only.
+    precision : dict, None, optional
+        Targets for the Monte Carlo standard errors keyed by outcome type, each a dict of the largest acceptable Monte
+        Carlo standard error for any of ``bias``, ``ese``, and ``coverage`` (see ``MetricAccumulator.meets``). Default
+        is None, which runs all ``sims`` replicates.
+    step : int, optional
+        Number of replicates between checks of the ``precision`` targets, which is also the fewest replicates that are
+        run. Rounds are made of whole blocks of ``batch_size``. Default is 100.
+    common_sizes : tuple, None, optional
+        Largest trial sizes (n1, n0) of the simulation grid. When given, the data is made with ``apply_scenario`` from
+        common random numbers of these sizes (see ``draw_common``), so every scenario and smaller trial size reuses the
+        same draws. Default is None, which draws the data for the scenario and trial sizes directly.
+    budget : dict, None, optional
+        Wall-clock and evaluation budget for the root-finding of each bridge estimator in each replicate, as the
+        arguments of ``SolverBudget`` (``seconds``, ``evaluations``). A wall-clock budget makes the results depend on
+        the speed of the machine for the replicates that use it up. Default is None, which has no budget.
+    warm_start : bool, optional
+        Whether the bridge estimators start from a ``WarmStart`` instead of fixed values. A replicate only reuses
+        solutions from its own block (for replicates refit after ``fit_batch``), so the results still do not depend on
+        the number of workers. Default is False.
+    compress : bool, optional
+        Whether the batched fits (with ``batch_size``) run the logistic models over the unique patterns of their rows.
+        The results are the same up to rounding. Default is False.
+
+    Returns
+    -------
+    dict :
+        Rows of ``summarize_replicates`` output keyed by outcome type. With ``precision``, the number of replicates and
+        the Monte Carlo standard errors are added to each row
+    """
+    outcomes = list(truths)
+    if batch_size is None:                                      # One random number stream per replicate
+        starts, sizes = range(sims), [1]*sims
+        seeds = [replicate_seed(seed, n1, n0, scenario, i, common=common_sizes is not None) for i in starts]
+        run = run_replicate
+    else:                                                       # One random number stream per block of replicates
+        starts = range(0, sims, batch_size)
+        keys = [(start, batch_size) if common_sizes is not None else (n1, n0, scenario, start, batch_size)
+                for start in starts]
+        seeds = [np.random.SeedSequence(seed, spawn_key=key) for key in keys]
+        sizes = [min(batch_size, sims - start) for start in starts]
+        run = partial(run_block, compress=compress)
+
+    # Replicates already in the store, for every outcome type
+    cells, done = {}, {continuous: set() for continuous in outcomes}
+    settings = {'seed': seed, 'sims': sims, 'batch_size': batch_size}
+    if common_sizes is not None:                                # Kept out otherwise, so earlier stores still resume
+        settings['common_sizes'] = list(common_sizes)
+    if budget is not None:
+        settings['budget'] = budget
+    if warm_start:
+        settings['warm_start'] = True
+    if compress and batch_size is not None:
+        settings['compress'] = True
+    if store is not None:
+        for continuous in outcomes:
+            cells[continuous] = store.cell(continuous=continuous, n1=n1, n0=n0, scenario=scenario, **settings)
+            store.describe(cells[continuous], continuous=continuous, n1=n1, n0=n0, scenario=scenario,
+                           truth=float(truths[continuous]),
+                           labels={'estimator': list(estimators), 'failure': list(failures)})
+            done[continuous] = store.done(cells[continuous])
+    accumulators = {continuous: {estimator: MetricAccumulator(scenario=scenario, estimator=estimator,
+                                                              diagnostic=estimator.endswith('MS'))
+                                 for estimator in estimators}
+                    for continuous in outcomes}
+    used = dict.fromkeys(outcomes, 0)                           # Replicates in the metrics of each outcome type
+    active = list(outcomes)                                     # Outcome types that are still being run
+    failed = {continuous: np.zeros((len(estimators), len(failures)), dtype=int) for continuous in outcomes}
+
+    # Rounds of replicates (a single round without precision targets)
+    size = sims if precision is None else step
+    for first in range(0, sims, size):
+        tasks = [t for t in range(len(starts)) if first <= starts[t] < first + size]
+        if len(tasks) == 0:
+            continue
+        last = starts[tasks[-1]] + sizes[tasks[-1]]             # Rounds are made of whole tasks
+
+        # Skipping the tasks whose replicates are all stored already, then running the remaining tasks and appending
+        #   the results to the store (or accumulators) as they come in
+        todo = [t for t in tasks if any(not done[continuous].issuperset(range(starts[t], starts[t] + sizes[t]))
+                                        for continuous in active)]
+        task = partial(run, n1=n1, n0=n0, scenario=scenario, outcomes=active, common_sizes=common_sizes,
+                       budget=budget, warm_start=warm_start)
+        if batch_size is None:
+            args = ([seeds[t] for t in todo], )
+            options = {'chunksize': chunksize}
+        else:
+            args = ([seeds[t] for t in todo], [sizes[t] for t in todo])
+            options = {}
+        outputs = map(task, *args) if pool is None else pool.map(task, *args, **options)
+        pending = {continuous: {} for continuous in active}     # Replicate results by index, not yet stored or added
+        n_pending = 0
+        for t, output in zip(todo, outputs):
+            for continuous in active:
+                block = [output[continuous]] if batch_size is None else output[continuous]
+                pending[continuous].update((i, rep) for i, rep in zip(range(starts[t], starts[t] + sizes[t]), block)
+                                           if i not in done[continuous])
+            n_pending += sizes[t]
+            if n_pending >= chunksize or batch_size is not None or t == todo[-1]:
+                for continuous in active:
+                    columns = _columns_(pending[continuous])
+                    np.add.at(failed[continuous], (columns['estimator'], columns['failure']), ~columns['converged'])
+                    if store is not None:
+                        store.append(cells[continuous], columns=columns)
+                    else:
+                        _accumulate_(accumulators[continuous], columns=columns, truth=truths[continuous])
+                    done[continuous].update(pending[continuous])
+                    pending[continuous] = {}
+                n_pending = 0
+
+        # Checking the precision targets of each outcome type after the round
+        for continuous in active:
+            used[continuous] = last
+            if store is not None and precision is not None:
+                columns = store.load(cells[continuous])
+                rows = (columns['replicate'] >= first) & (columns['replicate'] < last)
+                columns = {name: values[rows] for name, values in columns.items()}
+                _accumulate_(accumulators[continuous], columns=columns, truth=truths[continuous])
+        if precision is not None:
+            active = [continuous for continuous in active
+                      if not all(accumulators[continuous][estimator].meets(precision[continuous])
+                                 for estimator in estimators)]
+        if len(active) == 0:
+            break
+
+    # Reporting the failed replicates of this run
+    for continuous in outcomes:
+        for code, estimator in enumerate(estimators):
+            counts = failed[continuous][code]
+            if counts.sum() > 0:
+                reasons = ", ".join(failures[k] + ": " + str(counts[k]) for k in np.flatnonzero(counts))
+                warnings.warn("Scenario " + str(scenario) + " (n1=" + str(n1) + ", n0=" + str(n0) + ", "
+                              + ("continuous" if continuous else "binary") + "): " + str(counts.sum())
+                              + " replicates failed for " + estimator + " (" + reasons + ")", stacklevel=2)
+
+    # Performance metrics, from the stored results when there is a store
+    metrics = {}
+    for continuous in outcomes:
+        if store is not None:
+            table = store.table(cells=[cells[continuous]])
+            metrics[continuous] = summarize_replicates(replicates=table[table['replicate'] < used[continuous]],
+                                                       scenario=scenario, mcse=precision is not None)
+        else:
+            metrics[continuous] = [accumulators[continuous][estimator].metrics()
+                                   + (accumulators[continuous][estimator].mcse() if precision is not None else ())
+                                   for estimator in estimators]
+    return metrics
+
+
+def summarize_replicates(replicates, scenario, mcse=False):
+    """Compute the performance metrics for each estimator from the replicate results of a scenario.
+
+    Parameters
+    ----------
+    replicates : DataFrame
+        Replicate results with a row per estimator and replicate, with the columns of ``fields``, the estimator label,
+        and the truth
+    scenario : int, str
+        Label for the scenario
+    mcse : bool, optional
+        Whether to add the number of replicates and the Monte Carlo standard errors. Default is False.
+
+    Returns
+    -------
+    list :
+        Rows with the scenario, estimator, and metrics from ``aggregate_metrics``, in the order of ``estimators``
+    """
+    table = aggregate_metrics(replicates, by=("estimator", ), mcse=mcse)
+    return [(scenario, estimator) + tuple(table.loc[estimator]) for estimator in estimators]
+
+
+def init_worker():
+    """Initializer for worker processes, to ignore RuntimeWarnings (divide by zero in root-finding) as in the main
+    process.
+    """
+    warnings.filterwarnings("ignore", category=RuntimeWarning)
+
+
+def _columns_(replicates):
+    """Internal function to convert replicate results (``fit_replicate`` output keyed by the replicate index) into
+    columns with a row per estimator and replicate, with the estimator coded by its position in ``estimators``.
+    """
+    index = np.repeat(np.fromiter(replicates, dtype=np.int64, count=len(replicates)), len(estimators))
+    values = np.asarray([[rep[estimator] for estimator in estimators] for rep in replicates.values()], dtype=float)
+    values = values.reshape(-1, len(fields))
+    columns = {'replicate': index, 'estimator': np.tile(np.arange(len(estimators), dtype=np.int8), len(replicates))}
+    columns.update({name: values[:, j] for j, name in enumerate(fields)})
+    columns['converged'] = columns['converged'] == 1
+    columns['attempts'] = columns['attempts'].astype(np.int8)
+    columns['failure'] = columns['failure'].astype(np.int8)
+    columns['iterations'] = columns['iterations'].astype(np.int32)
+    return columns
+
+
+def _accumulate_(accumulators, columns, truth):
+    """Internal function to add replicate results (output of ``_columns_``) to the ``MetricAccumulator`` of each
+    estimator.
+    """
+    for code, estimator in enumerate(estimators):
+        rows = columns['estimator'] == code
+        c = {name: values[rows] for name, values in columns.items()}
+        accumulators[estimator].update(bias=c['estimate'] - truth, se=np.sqrt(c['variance']),
+                                       coverage=covers(c['lower'], c['upper'], truth),
+                                       bias_diagnostic=c['diag_estimate'] - 0,
+                                       coverage_diagnostic=covers(c['diag_lower'], c['diag_upper'], 0))
+
+
+def _fit_(estr, diagnostic, attempts=({}, ), budget=None):
+    """Internal function to fit an M-estimator and extract the replicate results. The attempts (options for
+    ``estimate``, with any starting values under ``init``) are tried in order until one gives a finite estimate and
+    variance, all within a single ``SolverBudget``. Failures are returned as NaN, with the reason for the last failure,
+    and a success after failed attempts keeps the reason for the first one. The iterations of every attempt are counted.
+    """
+    start = time.perf_counter()
+    if budget is not None:
+        budget = SolverBudget(**budget)
+    failure, first, iterations = 'none', None, 0
+    for k, options in enumerate(attempts):
+        if first is None and failure != 'none':                 # Reason for the first failed attempt
+            first = failure
+        options = dict(options)
+        if 'init' in options:
+            estr.init = np.asarray(options.pop('init'), dtype=float)
+        if budget is not None:
+            options['budget'] = budget
+        if hasattr(estr, 'iterations'):                         # Naive estimators are solved directly
+            estr.iterations = None
+        try:
+            estr.estimate(**options)
+        except BudgetExceeded:                                  # No further attempts once the budget is used up
+            failure = 'budget'
+            break
+        except (np.linalg.LinAlgError, ValueError):
+            failure = 'singular'
+            continue
+        except RuntimeError:
+            failure = 'nonconvergence'
+            continue
+        finally:
+            iterations += getattr(estr, 'iterations', None) or 0
+        kept = 2 if diagnostic else 1                           # Parameters that are kept, see _summary_
+        if not (np.all(np.isfinite(estr.theta[:kept])) and np.all(np.isfinite(np.diag(estr.variance)[:kept]))):
+            failure = 'nonfinite'
+            continue
+        return _summary_(theta=estr.theta, variance=estr.variance, ci=estr.confidence_intervals(), converged=True,
+                         diagnostic=diagnostic, seconds=time.perf_counter() - start, attempts=k + 1,
+                         iterations=iterations, failure=first or failure)
+    return (np.nan, )*8 + (False, time.perf_counter() - start, k + 1, failures.index(failure), iterations)
+
+
+def _summary_(theta, variance, ci, converged, diagnostic, seconds, attempts=1, iterations=0, failure=None):
+    """Internal function to extract the replicate results (values of ``fields``) from the estimated parameters."""
+    values = theta[0], variance[0, 0], ci[0, 0], ci[0, 1]
+    if diagnostic:
+        values += theta[1], variance[1, 1], ci[1, 0], ci[1, 1]
+    else:
+        values += (np.nan, )*4
+    if failure is None:
+        failure = 'none' if converged else 'nonconvergence'
+    return values + (bool(converged), seconds, attempts, failures.index(failure), iterations)
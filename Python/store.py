@@ -0,0 +1,234 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Append-only, columnar store for the replicate-level results, so simulation runs can be resumed and the metrics
+#   recomputed without rerunning the simulation
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+class ReplicateStore:
+    """Append-only, columnar store of the replicate-level results of a simulation experiment. Each cell of the
+    simulation grid has its own directory, with one raw binary file per column (named by the column and its dtype) and
+    a JSON file that describes the cell (sample sizes, scenario, truth, and labels of coded columns). Rows are only ever
+    appended (and flushed to disk) as blocks of replicates finish, so a run that is stopped keeps everything written
+    so far, and a restart can skip the replicates that are done. The ``replicate`` column is written last, so it marks
+    the rows that are complete, and the rows of each replicate are appended together, so a replicate with fewer rows
+    than the others can only be the last one (partly written) and is dropped. A cell should only be written by one run
+    at a time.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for the stored results, created if it does not exist
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def cell(continuous, n1, n0, scenario, **settings):
+        """Name of a cell of the simulation grid. The outcome type, sample sizes, and scenario make up a readable
+        prefix, and any other settings that change the results (seed, number of replicates, batch size) enter through a
+        hash, so results from runs with different settings are never mixed.
+
+        Parameters
+        ----------
+        continuous : bool
+            Whether the continuous (True) or binary (False) outcome is being estimated
+        n1 : int
+            Number of observations in the trial in the target population
+        n0 : int
+            Number of observations in the trial in the secondary population
+        scenario : int
+            Scenario for the data generating mechanism
+        **settings :
+            Remaining settings of the simulation run, which must be JSON serializable
+
+        Returns
+        -------
+        str
+        """
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+        ctype = "c" if continuous else "b"
+        return ctype + "_n" + str(n1) + "n" + str(n0) + "_s" + str(scenario) + "_" + digest
+
+    def describe(self, cell, **info):
+        """Store the description of a cell, which is added to its rows by ``table``. Lists of labels under ``labels``
+        are used to decode the integer columns of the same name.
+
+        Parameters
+        ----------
+        cell : str
+            Name of the cell, see ``ReplicateStore.cell``
+        **info :
+            Description of the cell, which must be JSON serializable
+
+        Returns
+        -------
+        None
+        """
+        path = os.path.join(self.directory, cell, "cell.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + "." + str(os.getpid()) + ".tmp"           # Write then rename, so a partial file is never read
+        with open(tmp_path, "w") as f:
+            json.dump(info, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def append(self, cell, columns):
+        """Append rows to the stored results of a cell.
+
+        Parameters
+        ----------
+        cell : str
+            Name of the cell, see ``ReplicateStore.cell``
+        columns : dict
+            One-dimensional array for each column, all of the same length, including ``replicate``, with all the rows
+            of a replicate in the same append. The dtype of each column is kept from its first append.
+
+        Returns
+        -------
+        None
+        """
+        folder = os.path.join(self.directory, cell)
+        os.makedirs(folder, exist_ok=True)
+        n_rows = self._align_(folder)
+        paths = self._columns_(folder)
+        for name in sorted(columns, key=lambda name: name == 'replicate'):  # Replicate column goes last
+            values = np.asarray(columns[name])
+            if name not in paths:
+                if n_rows > 0:
+                    raise ValueError("Column '" + name + "' is not in the stored results of cell " + cell)
+                paths[name] = os.path.join(folder, name + "." + values.dtype.str[1:] + ".bin")
+            with open(paths[name], "ab") as f:
+                f.write(np.ascontiguousarray(values, dtype=self._dtype_(paths[name])).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self, cell):
+        """Stored rows of a cell.
+
+        Parameters
+        ----------
+        cell : str
+            Name of the cell, see ``ReplicateStore.cell``
+
+        Returns
+        -------
+        dict :
+            One-dimensional array for each column
+        """
+        paths = self._columns_(os.path.join(self.directory, cell))
+        if 'replicate' not in paths:
+            return {}
+        replicate = self._replicate_(paths['replicate'])
+        n_rows = self._whole_(replicate)
+        return {name: replicate[:n_rows] if name == 'replicate' else
+                np.fromfile(path, dtype=self._dtype_(path), count=n_rows) for name, path in paths.items()}
+
+    def done(self, cell):
+        """Replicates of a cell that are already stored.
+
+        Parameters
+        ----------
+        cell : str
+            Name of the cell, see ``ReplicateStore.cell``
+
+        Returns
+        -------
+        set
+        """
+        return set(self.load(cell).get('replicate', np.empty(0, dtype=int)).tolist())
+
+    def cells(self):
+        """Names of the described cells in the store.
+
+        Returns
+        -------
+        list
+        """
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.exists(os.path.join(self.directory, name, "cell.json")))
+
+    def table(self, cells=None):
+        """Stored rows of the cells as a single data set, with the description of each cell added as columns and the
+        coded columns converted to their labels.
+
+        Parameters
+        ----------
+        cells : list, None, optional
+            Names of the cells to include. Default is None, which includes all described cells.
+
+        Returns
+        -------
+        DataFrame
+        """
+        frames = []
+        for cell in (self.cells() if cells is None else cells):
+            with open(os.path.join(self.directory, cell, "cell.json")) as f:
+                info = json.load(f)
+            frame = pd.DataFrame(self.load(cell))
+            for name, labels in info.pop('labels', {}).items():
+                if name in frame:
+                    frame[name] = pd.Categorical.from_codes(frame[name], categories=labels)
+            for name, value in info.items():
+                frame[name] = value
+            frame['cell'] = cell
+            frames.append(frame)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _align_(self, folder):
+        """Internal function to drop any rows that were only partly written (from a run that was stopped during a
+        write), along with the rest of their replicate, so the columns stay aligned and every stored replicate is
+        whole. Returns the number of complete rows.
+        """
+        paths = self._columns_(folder)
+        n_rows = 0
+        if 'replicate' in paths:
+            n_rows = self._whole_(self._replicate_(paths['replicate']))
+        for path in paths.values():
+            size = n_rows * self._dtype_(path).itemsize
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+        return n_rows
+
+    @classmethod
+    def _replicate_(cls, path):
+        """Internal function for the complete rows of the replicate column."""
+        dtype = cls._dtype_(path)
+        return np.fromfile(path, dtype=dtype, count=os.path.getsize(path) // dtype.itemsize)
+
+    @staticmethod
+    def _whole_(replicate):
+        """Internal function for the number of rows that make up whole replicates. Only the last replicate can be
+        partly written, which is when it has fewer rows than the most of any replicate.
+        """
+        if replicate.shape[0] == 0:
+            return 0
+        values, counts = np.unique(replicate, return_counts=True)
+        last = counts[values == replicate[-1]][0]                   # Rows of the last replicate
+        if last < np.max(counts):
+            return replicate.shape[0] - last
+        return replicate.shape[0]
+
+    @staticmethod
+    def _columns_(folder):
+        """Internal function for the file of each stored column of a cell."""
+        if not os.path.isdir(folder):
+            return {}
+        return {name.split(".")[0]: os.path.join(folder, name)
+                for name in sorted(os.listdir(folder)) if name.endswith(".bin")}
+
+    @staticmethod
+    def _dtype_(path):
+        """Internal function for the dtype of a column from its file name."""
+        return np.dtype(os.path.basename(path).split(".")[1])
@@ -0,0 +1,20 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Regression checks for the data generating mechanism (run with pytest)
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import numpy as np
+
+from dgm import exact_truth, stream_truth
+
+
+def test_exact_truth_monte_carlo():
+    """Truths by numerical integration agree with simulated truths of every scenario, within four Monte Carlo standard
+    errors.
+    """
+    for scenario in range(1, 6):
+        truth, se = stream_truth(n=2000000, scenario=scenario, seed=scenario)
+        np.testing.assert_array_less(np.abs(np.asarray(exact_truth(scenario=scenario)) - truth), 4 * np.asarray(se))
@@ -0,0 +1,51 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Regression checks for the estimator classes (run with pytest)
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import numpy as np
+
+from dgm import generate_arrays
+from efuncs import BridgeSingleSpan, BridgeMultiSpan, ee_bridge_ms
+from mestimation import solve_two_stage
+
+
+def test_shared_designs_not_float64():
+    """Distinct integer design matrices, shared between the missing models in an interleaved pattern, give the same
+    estimating functions as the float64 versions (models must never pick up another model's design matrix).
+    """
+    d = generate_arrays(n1=600, n0=400, scenario=4, rng=np.random.default_rng(1))
+    rng = np.random.default_rng(3)
+    Va = np.column_stack([np.ones(1000), d['V'][:, 1], rng.integers(0, 3, 1000)]).astype(np.int64)
+    Vb = np.column_stack([np.ones(1000), rng.integers(0, 2, 1000), d['V'][:, 1]]).astype(np.int64)
+    theta = np.concatenate([[1, 2, 200, 180, 170, 150], rng.normal(0, 0.1, 3 + 4*3)])
+
+    results = []
+    for a, b in [(Va, Vb), (Va.astype(float), Vb.astype(float))]:
+        data = dict(y=d['y'], a=d['a'], r=d['r'], m=d['m'], W=d['W'], V3=a, V2a=b, V2b=a, V1=b)
+        estimator = BridgeMultiSpan(**data)
+        results.append((estimator.psi(theta).sum(axis=1), estimator.jacobian(theta),
+                        ee_bridge_ms(theta, **data).sum(axis=1)))
+
+    for integer, floating in zip(*results):
+        np.testing.assert_allclose(integer, floating, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(results[1][0], results[1][2], rtol=1e-9, atol=1e-6)
+
+
+def test_jacobian_finite_differences():
+    """Analytic derivatives of the bridge estimators match central finite differences of their estimating functions,
+    away from the root so that every term contributes.
+    """
+    d = generate_arrays(n1=600, n0=400, scenario=2, rng=np.random.default_rng(5))
+    data = dict(y=d['y'], a=d['a'], r=d['r'], m=d['m'], W=d['W'])
+    rng = np.random.default_rng(2)
+    for estimator in [BridgeSingleSpan(V3=d['V'], V1=d['V'], **data),
+                      BridgeMultiSpan(V3=d['V'], V2a=d['V'], V2b=d['V'], V1=d['V'], **data)]:
+        theta = solve_two_stage(estimator) + rng.normal(0, 0.05, estimator.n_params)
+        step = 1e-6 * np.identity(estimator.n_params)
+        numerical = np.column_stack([(estimator.psi(theta + h).sum(axis=1) - estimator.psi(theta - h).sum(axis=1))
+                                     / (2 * 1e-6) for h in step])
+        np.testing.assert_allclose(estimator.jacobian(theta), numerical, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,44 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Regression checks for the M-estimators and solvers (run with pytest)
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import numpy as np
+from delicatessen import MEstimator
+
+from dgm import generate_arrays
+from efuncs import BridgeSingleSpan, BridgeMultiSpan, NaiveSingleSpan, NaiveMultiSpan, ee_naive_ss, ee_naive_ms
+from mestimation import AnalyticMEstimator, NaiveDirectEstimator, solve_two_stage
+
+
+def test_two_stage_matches_joint_search():
+    """The two-stage solver finds the same root of the bridge estimators' stacked estimating functions as a joint
+    Levenberg-Marquardt search over all parameters.
+    """
+    d = generate_arrays(n1=600, n0=400, scenario=2, rng=np.random.default_rng(5))
+    data = dict(y=d['y'], a=d['a'], r=d['r'], m=d['m'], W=d['W'])
+    for estimator in [BridgeSingleSpan(V3=d['V'], V1=d['V'], **data),
+                      BridgeMultiSpan(V3=d['V'], V2a=d['V'], V2b=d['V'], V1=d['V'], **data)]:
+        theta = solve_two_stage(estimator)
+        estr = AnalyticMEstimator(estimator.psi, jacobian=estimator.jacobian, init=theta + 0.01)
+        estr.estimate(solver='lm', tolerance=1e-12)
+        np.testing.assert_allclose(theta, estr.theta, rtol=1e-8, atol=1e-8)
+
+
+def test_naive_direct_matches_mestimator():
+    """The closed-form naive estimators give the same parameters and sandwich variance as delicatessen's M-estimator
+    (with exact derivatives) of the naive estimating functions, for both outcome types.
+    """
+    d = generate_arrays(n1=600, n0=400, scenario=2, rng=np.random.default_rng(5))
+    for y in [d['y'], d['b']]:
+        for estimator, ee in [(NaiveSingleSpan, ee_naive_ss), (NaiveMultiSpan, ee_naive_ms)]:
+            direct = NaiveDirectEstimator(estimator, y=y, m=d['m'], a=d['a'], r=d['r'])
+            direct.estimate()
+            estr = MEstimator(lambda theta: ee(theta, y=y, a=d['a'], r=d['r'], m=d['m']), init=list(direct.theta + 1))
+            estr.estimate(solver='lm', tolerance=1e-12, deriv_method='exact')
+            scale = np.max(np.abs(direct.variance))
+            np.testing.assert_allclose(direct.theta, estr.theta, rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(direct.variance, estr.variance, rtol=1e-12, atol=1e-12*scale)
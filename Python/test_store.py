@@ -0,0 +1,31 @@
+############################################################################################################
+# Fusing Trial Data for Treatment Comparisons: Single versus Multi-Span Bridging
+#   Regression checks for the replicate store (run with pytest)
+#
+# Paul Zivich (2023/04/27)
+############################################################################################################
+
+# Importing dependencies
+import os
+import numpy as np
+
+from store import ReplicateStore
+
+
+def test_torn_write_drops_partial_replicate(tmp_path):
+    """A write stopped part way through the rows of a replicate drops that replicate, so it is rerun on resume and every
+    stored replicate has a row for each estimator.
+    """
+    store = ReplicateStore(str(tmp_path))
+    columns = {'replicate': np.repeat(np.arange(20), 4), 'estimator': np.tile(np.arange(4, dtype=np.int8), 20),
+               'estimate': np.arange(80.)}
+    store.append('cell', columns=columns)
+    path = os.path.join(str(tmp_path), 'cell', 'replicate.i8.bin')
+    os.truncate(path, 78*8)                                     # Last replicate with 2 of its 4 rows
+    assert store.done('cell') == set(range(19))
+
+    store.append('cell', columns={name: values[76:] for name, values in columns.items()})
+    stored = store.load('cell')
+    assert store.done('cell') == set(range(20))
+    assert np.all(np.bincount(stored['replicate']) == 4)
+    np.testing.assert_array_equal(stored['estimate'], columns['estimate'])